@@ -0,0 +1,87 @@
+import time
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    name: str
+    failure_threshold: int
+    reset_timeout: float
+    state: str
+    consecutive_failures: int
+    successes: int
+    failures: int
+    trips: int
+    rejections: int
+    _opened_at: float
+    _probe_in_flight: bool
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitBreaker.CLOSED
+        self.consecutive_failures = 0
+        self.successes = 0
+        self.failures = 0
+        self.trips = 0
+        self.rejections = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+
+    def allow_request(self) -> tuple[bool, bool]:
+        # returns (allowed, is_probe); only the caller that claimed the probe may release it
+        if self.state == CircuitBreaker.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                self.rejections += 1
+                return (False, False)
+            # cool-down has passed; let a single caller through to probe whether the service recovered
+            self.state = CircuitBreaker.HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == CircuitBreaker.HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejections += 1
+                return (False, False)
+            self._probe_in_flight = True
+            return (True, True)
+        return (True, False)
+
+
+    def record_success(self):
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.state = CircuitBreaker.CLOSED
+        self._probe_in_flight = False
+
+
+    def release_probe(self):
+        # the probe ended without a verdict (e.g. it was cancelled); let the next caller probe instead.
+        # call only when allow_request handed this caller the probe
+        self._probe_in_flight = False
+
+
+    def record_failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.state == CircuitBreaker.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != CircuitBreaker.OPEN:
+                self.trips += 1
+            self.state = CircuitBreaker.OPEN
+            self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "successes": self.successes,
+            "failures": self.failures,
+            "trips": self.trips,
+            "rejections": self.rejections
+        }
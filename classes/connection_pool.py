@@ -0,0 +1,89 @@
+import asyncio
+import contextlib
+import time
+from typing import Awaitable, Callable
+
+
+class DatabaseUnavailableError(Exception):
+    pass
+
+
+class ConnectionPool:
+
+    max_size: int
+    idle_timeout: float
+    health_check_after: float
+    _connect: Callable[[], Awaitable[object]]
+    _idle: list[tuple[object, float]]
+    _semaphore: asyncio.Semaphore
+
+    def __init__(self, connect: Callable[[], Awaitable[object]], max_size: int, idle_timeout: float, health_check_after: float):
+        self._connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self._idle = []
+        self._semaphore = asyncio.Semaphore(max_size)
+
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        # at most max_size connections are checked out at once; everyone else waits here
+        await self._semaphore.acquire()
+        connection = None
+        try:
+            connection = await self._acquire()
+            yield connection
+        except BaseException:
+            # a connection that was in use when something failed is in an unknown state, so do not reuse it
+            if connection is not None:
+                await self._discard(connection)
+                connection = None
+            raise
+        finally:
+            if connection is not None:
+                self._idle.append((connection, time.monotonic()))
+            self._semaphore.release()
+
+
+    async def evict_idle(self):
+        now = time.monotonic()
+        expired = [c for c, last_used in self._idle if now - last_used > self.idle_timeout]
+        self._idle = [(c, last_used) for c, last_used in self._idle if now - last_used <= self.idle_timeout]
+        for connection in expired:
+            await self._discard(connection)
+
+
+    async def close(self):
+        idle = self._idle
+        self._idle = []
+        for connection, _ in idle:
+            await self._discard(connection)
+
+
+    def size(self) -> int:
+        return len(self._idle)
+
+
+    async def _acquire(self):
+        await self.evict_idle()
+        # reuse the most recently returned connection first, since it is the least likely to have timed out server-side
+        while len(self._idle) > 0:
+            connection, last_used = self._idle.pop()
+            if time.monotonic() - last_used < self.health_check_after:
+                return connection
+            if await asyncio.to_thread(connection.is_connected):
+                return connection
+            await self._discard(connection)
+
+        connection = await self._connect()
+        if connection is None:
+            raise DatabaseUnavailableError("Could not open a database connection")
+        return connection
+
+
+    async def _discard(self, connection):
+        try:
+            await asyncio.to_thread(connection.close)
+        except Exception:
+            pass
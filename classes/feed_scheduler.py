@@ -0,0 +1,56 @@
+import datetime
+import itertools
+import random
+import time
+
+from classes.parsed_feed import ParsedFeedHeader
+from state import Program, Utility
+
+
+class FeedScheduler:
+    # when to poll each feed next; the polling itself runs as one job per feed on Program's job scheduler
+
+    def get_interval_from_feed(feed: ParsedFeedHeader) -> float:
+        published = sorted((item.published.timestamp() for item in itertools.islice(feed.iter_items(), Program.RSS_FEED_RATE_SAMPLE_SIZE)), reverse=True)
+        if len(published) < 2:
+            interval = Program.RSS_FEED_UPDATE_TIMER
+        else:
+            # poll about twice per expected story; a feed that has gone quiet since its last story slows down with it
+            mean_gap = (published[0] - published[-1]) / (len(published) - 1)
+            since_newest = time.time() - published[0]
+            interval = max(mean_gap, since_newest) / 2
+        interval = min(max(interval, Program.RSS_FEED_MIN_POLL_INTERVAL), Program.RSS_FEED_MAX_POLL_INTERVAL)
+
+        # the publisher's <ttl> is a floor on how often we may ask
+        if feed.ttl != None:
+            interval = max(interval, feed.ttl * 60)
+        return interval
+
+
+    def parse_retry_after(value: str | None) -> float | None:
+        if Utility.is_null_or_whitespace(value):
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            from email.utils import parsedate_to_datetime
+            retry_at = parsedate_to_datetime(value)
+            return max(0.0, retry_at.timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+    def skip_to_allowed_hour(due: float, skip_hours: set[int]) -> float:
+        if len(skip_hours) == 0 or len(skip_hours) >= 24:
+            return due
+        due_date = datetime.datetime.fromtimestamp(due, datetime.timezone.utc)
+        while due_date.hour in skip_hours:
+            due_date = due_date.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1)
+        return due_date.timestamp()
+
+
+    def add_jitter(delay: float) -> float:
+        # spread feeds with identical intervals so they do not all come due in the same tick
+        return delay * random.uniform(1 - Program.RSS_FEED_POLL_JITTER, 1 + Program.RSS_FEED_POLL_JITTER)
+
@@ -1,20 +1,62 @@
+from state import Program
+
 class FeedSubscriber():
 
     feed_name: str
     feed_url: str
     subscribing_channels: list[int]
-    
-    def __init__(self, name, url, channels):
+    etag: str | None
+    last_modified: str | None
+    database_id: int | None
+    seen_items: dict[str, None]
+    poll_interval: float | None
+    skip_hours: set[int]
+
+    def __init__(self, name, url, channels, etag=None, last_modified=None, seen_items=None, database_id=None):
         self.feed_name = name
         self.feed_url = url
         self.subscribing_channels = channels
         if self.subscribing_channels == None:
             self.subscribing_channels = []
+        self.etag = etag
+        self.last_modified = last_modified
+        self.database_id = database_id
+        # insertion-ordered, so the oldest keys are the first to be dropped
+        self.seen_items = dict.fromkeys(seen_items if seen_items != None else [])
+        # learned at runtime by the poll scheduler
+        self.poll_interval = None
+        self.skip_hours = set()
+
+
+    def get_conditional_headers(self) -> dict:
+        headers = {}
+        if self.etag != None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified != None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+    def has_seen(self, item_key: str) -> bool:
+        return item_key in self.seen_items
+
+
+    def mark_seen(self, item_keys: list[str]):
+        for item_key in item_keys:
+            self.seen_items.pop(item_key, None)
+            self.seen_items[item_key] = None
+        overflow = len(self.seen_items) - Program.RSS_FEED_SEEN_ITEMS_LIMIT
+        if overflow > 0:
+            for item_key in list(self.seen_items.keys())[:overflow]:
+                del self.seen_items[item_key]
 
 
     def as_dict(self) -> dict:
         return {
             "feed_name": self.feed_name,
             "feed_url": self.feed_url,
-            "subscribing_channels": self.subscribing_channels 
-        }
\ No newline at end of file
+            "subscribing_channels": self.subscribing_channels,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "seen_items": list(self.seen_items.keys())
+        }
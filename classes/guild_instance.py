@@ -1,13 +1,23 @@
+import asyncio
 import discord
+from collections import deque
 from state import Program   
 
 class GuildInstance:
     _channel_dict: dict[str, discord.TextChannel]
     guild: discord.Guild
+    queued_media: deque
+    now_playing: object | None
+    _prefetched: tuple[object, discord.AudioSource] | None
+    playback_lock: asyncio.Lock
 
     def __init__(self, guild_id) -> None:
         self.guild = Program.bot.get_guild(guild_id)
-        self.queued_media = []
+        self.queued_media = deque()
+        self.now_playing = None
+        self._prefetched = None
+        # held from taking the next item until it is playing, so two callers cannot both start one
+        self.playback_lock = asyncio.Lock()
         self._channel_dict = {}
     
 
@@ -29,6 +39,62 @@ class GuildInstance:
         return self._channel_dict.get(channel_type, None)
 
 
+    # #########################
+    # Media queue
+    # #########################
+
+    def enqueue(self, media, at_front=False) -> bool:
+        if len(self.queued_media) >= Program.MEDIA_QUEUE_LIMIT:
+            return False
+        if at_front:
+            self.queued_media.appendleft(media)
+        else:
+            self.queued_media.append(media)
+        return True
+
+
+    def pop_next(self) -> tuple[object | None, discord.AudioSource | None]:
+        # hands back the warmed source along with the item when the prefetch was for this item
+        if len(self.queued_media) == 0:
+            return (None, None)
+        media = self.queued_media.popleft()
+        source = None
+        if self._prefetched is not None and self._prefetched[0] is media:
+            source = self._prefetched[1]
+            self._prefetched = None
+        return (media, source)
+
+
+    def get_prefetch_target(self) -> object | None:
+        # the item whose source should be warming up, or None when the right one already is
+        if len(self.queued_media) == 0:
+            self.discard_prefetched()
+            return None
+        if self._prefetched is not None and self._prefetched[0] is self.queued_media[0]:
+            return None
+        self.discard_prefetched()
+        return self.queued_media[0]
+
+
+    def set_prefetched(self, media, source: discord.AudioSource):
+        # the queue may have moved on while the source was being opened
+        if len(self.queued_media) > 0 and self.queued_media[0] is media and self._prefetched is None:
+            self._prefetched = (media, source)
+        else:
+            source.cleanup()
+
+
+    def discard_prefetched(self):
+        if self._prefetched is not None:
+            self._prefetched[1].cleanup()
+            self._prefetched = None
+
+
+    def clear_queue(self):
+        self.queued_media.clear()
+        self.discard_prefetched()
+
+
     def as_dict(self):
         return {k: v.id for k, v in self._channel_dict.items()}
     
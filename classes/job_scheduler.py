@@ -0,0 +1,244 @@
+import asyncio
+import datetime
+import heapq
+import json
+import os
+import time
+
+from state import Program
+
+
+class ScheduledJob:
+
+    job_id: str
+    callback: object
+    interval: float | None
+    daily_at: datetime.time | None
+    persist: bool
+    catch_up: bool
+    next_run: float | None
+
+    def __init__(self, job_id: str, callback, interval: float | None = None, daily_at: datetime.time | None = None, persist=False, catch_up=False):
+        # callback is an async function taking no arguments; it may return a timestamp to override its next run
+        self.job_id = job_id
+        self.callback = callback
+        self.interval = interval
+        self.daily_at = daily_at
+        self.persist = persist
+        self.catch_up = catch_up
+        self.next_run = None
+
+
+    def get_next_run(self, after: float) -> float:
+        if self.daily_at is None:
+            return after + self.interval
+        # daily jobs follow the wall clock of the configured zone, so they stay on the hour across DST changes
+        zone = JobScheduler.get_timezone()
+        after_date = datetime.datetime.fromtimestamp(after, zone)
+        run_date = datetime.datetime.combine(after_date.date(), self.daily_at, tzinfo=zone)
+        if run_date.timestamp() <= after:
+            run_date = datetime.datetime.combine(after_date.date() + datetime.timedelta(days=1), self.daily_at, tzinfo=zone)
+        return run_date.timestamp()
+
+
+class JobScheduler:
+
+    _jobs: dict[str, ScheduledJob]
+    _queue: list[tuple[float, str]]
+    _running: set[str]
+    _tasks: set
+    _persisted_runs: dict[str, float] | None
+    _wakeup: asyncio.Event | None
+    _runner: asyncio.Task | None
+
+    def __init__(self):
+        self._jobs = {}
+        self._queue = []
+        self._running = set()
+        self._tasks = set()
+        self._persisted_runs = None
+        self._wakeup = None
+        self._runner = None
+
+
+    async def add_job(self, job: ScheduledJob, first_run: float | None = None):
+        # job ids are unique; registering one again replaces its definition but keeps its place in the queue
+        await self.load_persisted_runs()
+        now = time.time()
+        existing = self._jobs.get(job.job_id, None)
+        self._jobs[job.job_id] = job
+        persisted = self._persisted_runs.get(job.job_id, None) if job.persist else None
+
+        if existing is not None and existing.next_run is not None:
+            # its heap entry is still queued and stays valid for the replacement
+            job.next_run = existing.next_run
+            self.start()
+            return
+        if persisted is not None and persisted <= now and job.catch_up:
+            # the process was down when the job was due; run it once now rather than once per missed slot
+            Program.log(f"Job '{job.job_id}' missed its run at {datetime.datetime.fromtimestamp(persisted)}; running it now.",1)
+            job.next_run = now
+        elif first_run is not None:
+            job.next_run = first_run
+        else:
+            job.next_run = job.get_next_run(now)
+
+        self._push(job)
+        if job.persist:
+            await self.save_persisted_run(job)
+        self.start()
+
+
+    def remove_job(self, job_id: str):
+        self._jobs.pop(job_id, None)
+
+
+    def get_job_ids(self, prefix: str = "") -> list[str]:
+        return [job_id for job_id in self._jobs.keys() if job_id.startswith(prefix)]
+
+
+    def get_next_run(self, job_id: str) -> float | None:
+        job = self._jobs.get(job_id, None)
+        return job.next_run if job is not None else None
+
+
+    def start(self):
+        if self._runner is not None and not self._runner.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._runner = asyncio.get_running_loop().create_task(self._run())
+
+
+    async def stop(self):
+        tasks = list(self._tasks) + ([self._runner] if self._runner is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._runner = None
+
+
+    async def _run(self):
+        while True:
+            for job in self._pop_due(time.time()):
+                task = asyncio.get_running_loop().create_task(self._execute(job))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+            # sleep until the earliest job or until a new one is pushed; capped so a wall clock change is noticed
+            wait = self._seconds_until_next(time.time())
+            wait = Program.JOB_SCHEDULER_MAX_SLEEP if wait is None else min(wait, Program.JOB_SCHEDULER_MAX_SLEEP)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+
+    async def _execute(self, job: ScheduledJob):
+        result = None
+        try:
+            result = await job.callback()
+        except Exception as e:
+            Program.log(f"Job '{job.job_id}' failed: {repr(e)}",3)
+        finally:
+            self._running.discard(job.job_id)
+
+        # reschedule whichever definition is registered now, in case it was replaced while running
+        current = self._jobs.get(job.job_id, None)
+        if current is None:
+            return
+        if isinstance(result, (int, float)) and current is job:
+            current.next_run = float(result)
+        else:
+            current.next_run = current.get_next_run(time.time())
+        self._push(current)
+        if current.persist:
+            await self.save_persisted_run(current)
+
+
+    def _push(self, job: ScheduledJob):
+        # superseded heap entries stay behind and are skipped when popped because their time no longer matches
+        heapq.heappush(self._queue, (job.next_run, job.job_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+
+    def _is_current(self, entry: tuple[float, str]) -> bool:
+        job = self._jobs.get(entry[1], None)
+        return job is not None and job.next_run == entry[0]
+
+
+    def _pop_due(self, now: float) -> list[ScheduledJob]:
+        due_jobs = []
+        while len(self._queue) > 0 and self._queue[0][0] <= now:
+            entry = heapq.heappop(self._queue)
+            # a job that is still running is rescheduled when it finishes, so it never overlaps itself
+            if self._is_current(entry) and not entry[1] in self._running:
+                self._running.add(entry[1])
+                due_jobs.append(self._jobs[entry[1]])
+        return due_jobs
+
+
+    def _seconds_until_next(self, now: float) -> float | None:
+        while len(self._queue) > 0 and not self._is_current(self._queue[0]):
+            heapq.heappop(self._queue)
+        if len(self._queue) == 0:
+            return None
+        return max(0.0, self._queue[0][0] - now)
+
+
+    def __contains__(self, job_id: str) -> bool:
+        return job_id in self._jobs
+
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+
+    def get_timezone():
+        if Program.SCHEDULER_TIMEZONE is None:
+            # naive datetimes use the host's local zone, DST included
+            return None
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(Program.SCHEDULER_TIMEZONE)
+
+
+    # #########################
+    # Persistence
+    # #########################
+
+    def get_settings_filename() -> str:
+        return f"{Program.SETTINGS_DIRECTORY_PATH}/{Program.JOB_SETTINGS_FILE_NAME}"
+
+
+    async def load_persisted_runs(self):
+        if self._persisted_runs is not None:
+            return
+        self._persisted_runs = {}
+        if Program.use_database:
+            settings_rows = await Program.run_query_return_rows("SELECT name, value FROM discord.settings WHERE name LIKE %s", ("job:%",))
+            saved = {name[len("job:"):]: value for name, value in settings_rows}
+        elif os.path.exists(JobScheduler.get_settings_filename()):
+            with open(JobScheduler.get_settings_filename()) as file:
+                saved = json.load(file)
+        else:
+            saved = {}
+
+        for job_id, value in saved.items():
+            try:
+                self._persisted_runs[job_id] = datetime.datetime.fromisoformat(value).timestamp()
+            except (TypeError, ValueError):
+                Program.log(f"Ignoring unreadable next run '{value}' for job '{job_id}'",2)
+
+
+    async def save_persisted_run(self, job: ScheduledJob):
+        self._persisted_runs[job.job_id] = job.next_run
+        if Program.use_database:
+            next_run = datetime.datetime.fromtimestamp(job.next_run, datetime.timezone.utc).isoformat()
+            await Program.call_procedure_return_scalar("insert_or_update_settings", (f"job:{job.job_id}", next_run))
+        else:
+            if not os.path.exists(Program.SETTINGS_DIRECTORY_PATH):
+                os.makedirs(Program.SETTINGS_DIRECTORY_PATH)
+            data = {job_id: datetime.datetime.fromtimestamp(next_run, datetime.timezone.utc).isoformat() for job_id, next_run in self._persisted_runs.items()}
+            with open(JobScheduler.get_settings_filename(), "w") as file:
+                json.dump(data, file, indent=4)
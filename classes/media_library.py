@@ -0,0 +1,195 @@
+import asyncio
+import bisect
+import difflib
+import json
+import os
+import re
+
+from state import Program, Utility
+
+
+class LibraryTrack:
+
+    path: str
+    display_name: str
+    codec: str | None
+    duration: float | None
+
+    def __init__(self, path: str, display_name: str, codec: str | None, duration: float | None):
+        self.path = path
+        self.display_name = display_name
+        self.codec = codec
+        self.duration = duration
+
+
+class MediaLibrary:
+
+    root: str
+    entries: dict[str, dict]
+    _index_filename: str
+    _names: list[tuple[str, str]]
+    _name_paths: dict[str, list[str]]
+    _scan_lock: asyncio.Lock
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.entries = {}
+        self._index_filename = f"{Program.SETTINGS_DIRECTORY_PATH}/{Program.MEDIA_LIBRARY_FILE_NAME}"
+        self._names = []
+        self._name_paths = {}
+        self._scan_lock = asyncio.Lock()
+
+
+    # #########################
+    # Scanning
+    # #########################
+
+    async def scan(self):
+        # only new files and files whose mtime changed are probed; everything else keeps its indexed entry
+        if self._scan_lock.locked():
+            return
+        async with self._scan_lock:
+            files = await asyncio.to_thread(self.list_files)
+            changed = [(path, mtime, size) for path, (mtime, size) in files.items() if self.entries.get(path, {}).get("mtime", None) != mtime]
+            removed = [path for path in self.entries.keys() if not path in files]
+            for path in removed:
+                del self.entries[path]
+
+            semaphore = asyncio.Semaphore(Program.MEDIA_LIBRARY_PROBE_CONCURRENCY)
+            results = await asyncio.gather(*[self.probe_file(path, mtime, size, semaphore) for path, mtime, size in changed])
+            for entry in results:
+                if entry != None:
+                    self.entries[entry["path"]] = entry
+
+            if len(changed) > 0 or len(removed) > 0:
+                self.rebuild_names()
+                await asyncio.to_thread(self.write_index_to_json)
+            Program.log(f"Media library scan of {self.root}: {len(self.entries)} tracks, {len(changed)} probed, {len(removed)} removed",0)
+
+
+    def list_files(self) -> dict[str, tuple[float, int]]:
+        files = {}
+        for directory, _, file_names in os.walk(self.root):
+            for file_name in file_names:
+                if not os.path.splitext(file_name)[1].lower() in Program.MEDIA_LIBRARY_EXTENSIONS:
+                    continue
+                path = os.path.join(directory, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files[path] = (stat.st_mtime, stat.st_size)
+        return files
+
+
+    async def probe_file(self, path: str, mtime: float, size: int, semaphore: asyncio.Semaphore) -> dict | None:
+        async with semaphore:
+            probe = await Utility.ffprobe(path)
+        if probe is None:
+            Program.log(f"Could not probe library file {path}",1)
+            return None
+        streams = probe.get("streams", [])
+        stream = streams[0] if len(streams) > 0 else {}
+        container = probe.get("format", {})
+        # tag names vary in case between containers
+        tags = {k.lower(): v for k, v in {**container.get("tags", {}), **stream.get("tags", {})}.items()}
+        duration = str(container.get("duration", ""))
+        return {
+            "path": path,
+            "title": tags.get("title", None) or os.path.splitext(os.path.basename(path))[0],
+            "artist": tags.get("artist", None),
+            "album": tags.get("album", None),
+            "duration": float(duration) if re.fullmatch(r"\d+(\.\d+)?", duration) else None,
+            "codec": stream.get("codec_name", None),
+            "mtime": mtime,
+            "size": size
+        }
+
+
+    # #########################
+    # Lookup
+    # #########################
+
+    def normalize(text: str) -> str:
+        return " ".join(re.findall(r"\w+", text.lower()))
+
+
+    def rebuild_names(self):
+        # sorted (name, path) pairs so a prefix lookup is a bisect instead of a walk over every track
+        names = []
+        for path, entry in self.entries.items():
+            keys = set([entry["title"], os.path.splitext(os.path.basename(path))[0]])
+            if entry.get("artist", None) != None:
+                keys.add(f"{entry['artist']} {entry['title']}")
+            for key in keys:
+                normalized = MediaLibrary.normalize(key)
+                if len(normalized) > 0:
+                    names.append((normalized, path))
+        names.sort()
+        name_paths: dict[str, list[str]] = {}
+        for name, path in names:
+            name_paths.setdefault(name, []).append(path)
+        self._names = names
+        self._name_paths = name_paths
+
+
+    async def find(self, query: str, limit: int) -> list[LibraryTrack]:
+        normalized = MediaLibrary.normalize(query)
+        if len(normalized) == 0:
+            return []
+        # a rescan swaps in new lists rather than changing these, so the fuzzy pass can read them off the event loop
+        names = self._names
+        name_paths = self._name_paths
+        paths = []
+        position = bisect.bisect_left(names, (normalized, ""))
+        while position < len(names) and names[position][0].startswith(normalized) and len(paths) < limit:
+            if not names[position][1] in paths:
+                paths.append(names[position][1])
+            position += 1
+
+        # nothing starts with the query, so fall back to the closest spellings; that compares against every name, so not on the event loop
+        if len(paths) == 0:
+            close_names = await asyncio.to_thread(difflib.get_close_matches, normalized, list(name_paths.keys()), limit, Program.MEDIA_LIBRARY_FUZZY_CUTOFF)
+            for name in close_names:
+                for path in name_paths[name]:
+                    if not path in paths and len(paths) < limit:
+                        paths.append(path)
+        return [self.get_track(path) for path in paths if path in self.entries]
+
+
+    def get_track(self, path: str) -> LibraryTrack:
+        entry = self.entries[path]
+        display_name = entry["title"] if entry.get("artist", None) == None else f"{entry['artist']} - {entry['title']}"
+        return LibraryTrack(path, display_name, entry.get("codec", None), entry.get("duration", None))
+
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+    # #########################
+    # I/O functions
+    # #########################
+
+    def write_index_to_json(self):
+        if not os.path.exists(Program.SETTINGS_DIRECTORY_PATH):
+            os.makedirs(Program.SETTINGS_DIRECTORY_PATH)
+        with open(self._index_filename, "w") as file:
+            json.dump({"root": self.root, "tracks": list(self.entries.values())}, file, indent=4)
+
+
+    def load_index_from_json(self):
+        if not os.path.exists(self._index_filename):
+            return
+        try:
+            with open(self._index_filename) as file:
+                data = json.load(file)
+        except ValueError:
+            Program.log(f"Ignoring unreadable {self._index_filename}",2)
+            return
+        # an index built for another directory is no use here
+        if data.get("root", None) != self.root:
+            return
+        self.entries = {entry["path"]: entry for entry in data.get("tracks", [])}
+        self.rebuild_names()
+        Program.log(f"Loaded {len(self.entries)} library track(s) from {self._index_filename}",0)
@@ -6,16 +6,65 @@ from state import Utility
 
 class ParsedFeedItem:
 
+    key: str
     published: datetime.datetime
     title: str
     link: str
-    summary: str
-    image_urls: list[str]
-    video_urls: list[str]
+    _entry: dict
+    _summary: str | None
+    _image_urls: list[str] | None
+    _video_urls: list[str] | None
 
-    def __init__(self):
-        self.image_urls = []
-        self.video_urls = []
+    def __init__(self, entry):
+        # only the cheap fields are read up front; summary cleansing and media walking wait until something asks
+        self._entry = entry
+        self._summary = None
+        self._image_urls = None
+        self._video_urls = None
+        self.key = ParsedFeedItem.make_key(entry)
+        self.published = datetime.datetime.fromtimestamp(mktime(entry.get("published_parsed")))
+        self.published = self.published.replace(tzinfo=datetime.timezone.utc)
+        self.title = entry.get("title", "")
+        self.link = entry.get("link", "about:blank")
+
+
+    @property
+    def summary(self) -> str:
+        if self._summary == None:
+            self._summary = Utility.html_cleanse(self._entry.get("summary", ""))
+        return self._summary
+
+
+    @property
+    def image_urls(self) -> list[str]:
+        if self._image_urls == None:
+            self._read_media()
+        return self._image_urls
+
+
+    @property
+    def video_urls(self) -> list[str]:
+        if self._video_urls == None:
+            self._read_media()
+        return self._video_urls
+
+
+    def _read_media(self):
+        self._image_urls = []
+        self._video_urls = []
+        if self._entry.get("media_content", None) != None:
+            for media_object in self._entry.get("media_content"):
+                if media_object.get("medium", "image") == "image":
+                    self._image_urls.append(media_object.get("url", "about:blank"))
+                elif media_object.get("medium") == "video":
+                    self._video_urls.append(media_object.get("url", "about:blank"))
+
+
+    def make_key(entry) -> str:
+        # guid when the feed has one, otherwise the link; hashed so every feed's seen index has a fixed size per item
+        import hashlib
+        identity = entry.get("id", None) or entry.get("link", None) or f"{entry.get('title', '')}|{entry.get('published', '')}"
+        return hashlib.sha1(identity.encode("utf-8")).hexdigest()[:16]
 
 
 class ParsedFeedHeader:
@@ -25,34 +74,45 @@ class ParsedFeedHeader:
     link: str
     links: str
     image_url: str
-    last_modified: datetime.datetime
-    items: list[ParsedFeedItem]
+    etag: str | None
+    last_modified: str | None
+    ttl: int | None
+    skip_hours: set[int]
+    _entries: list
 
-    def __init__(self, feed):
+    def __init__(self, feed, skip_hours: set[int] | None = None):
         self.title = feed.feed.get("title", "")
         self.subtitle = feed.feed.get("subtitle", "")
         self.link = feed.feed.get("link", "about:blank")
         self.links = feed.feed.get("links", [])
         self.image_url = None
+        # http validators; feedparser only fills these when it fetches the url itself, so the fetcher sets them from the response headers
+        self.etag = None
+        self.last_modified = None
+        ttl = str(feed.feed.get("ttl", ""))
+        self.ttl = int(ttl) if ttl.isdigit() else None
+        self.skip_hours = skip_hours if skip_hours != None else set()
         if "image" in feed.feed:
             self.image_url = feed.feed.image.get("url", "about:blank")
 
-        self.items = []
-        for entry in feed.entries:
-            if entry.get("published", None) == None:
+        # hand entries out newest first, whichever way round the publisher wrote them, so readers can stop early
+        self._entries = feed.entries
+        dated_entries = [e for e in (self._entries[:1] + self._entries[-1:]) if e.get("published_parsed", None) != None]
+        if len(dated_entries) == 2 and dated_entries[0].get("published_parsed") < dated_entries[1].get("published_parsed"):
+            self._entries = list(reversed(self._entries))
+
+
+    def iter_items(self):
+        for entry in self._entries:
+            if entry.get("published", None) == None or entry.get("published_parsed", None) == None:
                 continue
-            # with open(f"logs/{self.title}-{datetime.datetime.timestamp(datetime.datetime.now())}.json", "w") as file:
-            #     json.dump(entry, file, indent=4)
-            item = ParsedFeedItem()
-            item.published = datetime.datetime.fromtimestamp(mktime(entry.get("published_parsed")))
-            item.published = item.published.replace(tzinfo=datetime.timezone.utc)
-            item.title = entry.get("title", "")
-            item.link = entry.get("link", "about:blank")
-            item.summary = Utility.html_cleanse(entry.get("summary", ""))
-            if entry.get("media_content", None) != None:
-                for media_object in entry.get("media_content"):
-                    if media_object.get("medium", "image") == "image":
-                        item.image_urls.append(media_object.get("url", "about:blank"))
-                    elif media_object.get("medium") == "video":
-                        item.video_urls.append(media_object.get("url", "about:blank"))
-            self.items.append(item)
+            yield ParsedFeedItem(entry)
+
+
+    def parse_skip_hours(body: bytes) -> set[int]:
+        # feedparser drops <skipHours>, so read it straight from the raw channel
+        skip_block = re.search(rb"<skipHours>(.*?)</skipHours>", body, re.DOTALL | re.IGNORECASE)
+        if skip_block is None:
+            return set()
+        hours = re.findall(rb"<hour>\s*(\d+)\s*</hour>", skip_block.group(1), re.IGNORECASE)
+        return set(int(h) % 24 for h in hours)
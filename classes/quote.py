@@ -1,6 +1,9 @@
 from state import MessageType, Utility
 
 class Quote:
+    # no per-instance __dict__; imports and index builds create one of these for every quote in a guild
+    __slots__ = ("quote", "author", "time_place")
+
     quote: str
     author: str
     time_place: str
@@ -48,6 +51,15 @@ class Quote:
         return full_text
     
 
+    def make_set_id(guild_id: int, quotes: list) -> int:
+        # the same set in the same guild always gets the same id, so re-importing it is a no-op
+        import hashlib
+        import json
+        canonical = json.dumps([guild_id] + [q.as_dict() for q in quotes], ensure_ascii=False, sort_keys=True)
+        digest = hashlib.sha1(canonical.encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") & 0x7FFFFFFFFFFFFFFF
+    
+
     def parse_from_raw(input: str):
         if Utility.is_null_or_whitespace(input):
             return ""
@@ -0,0 +1,64 @@
+import math
+import re
+
+from classes.quote import Quote
+
+
+class QuoteIndex:
+
+    postings: dict[str, dict[int, int]]
+    set_lengths: dict[int, int]
+
+    def __init__(self):
+        # token -> {set_id: occurrences}; a whole quote set is one document
+        self.postings = {}
+        self.set_lengths = {}
+
+
+    def tokenize(text: str | None) -> list[str]:
+        if text is None:
+            return []
+        return re.findall(r"\w+", text.lower())
+
+
+    def add_set(self, set_id: int, quotes: list[Quote]):
+        tokens = []
+        for quote in quotes:
+            tokens += QuoteIndex.tokenize(quote.quote) + QuoteIndex.tokenize(quote.author) + QuoteIndex.tokenize(quote.time_place)
+        if set_id in self.set_lengths:
+            self.remove_set(set_id)
+        self.set_lengths[set_id] = len(tokens)
+        for token in tokens:
+            counts = self.postings.setdefault(token, {})
+            counts[set_id] = counts.get(set_id, 0) + 1
+
+
+    def remove_set(self, set_id: int):
+        if self.set_lengths.pop(set_id, None) is None:
+            return
+        for token in [t for t, counts in self.postings.items() if set_id in counts]:
+            del self.postings[token][set_id]
+            if len(self.postings[token]) == 0:
+                del self.postings[token]
+
+
+    def search(self, query: str, limit: int) -> list[int]:
+        # tf-idf over the query terms; sets matching more of the terms always rank above sets matching fewer
+        terms = set(QuoteIndex.tokenize(query))
+        set_count = len(self.set_lengths)
+        matched_terms: dict[int, int] = {}
+        scores: dict[int, float] = {}
+        for term in terms:
+            counts = self.postings.get(term, None)
+            if counts is None:
+                continue
+            idf = math.log(1 + set_count / len(counts))
+            for set_id, occurrences in counts.items():
+                matched_terms[set_id] = matched_terms.get(set_id, 0) + 1
+                scores[set_id] = scores.get(set_id, 0.0) + (occurrences / max(self.set_lengths[set_id], 1)) * idf
+        ranked = sorted(scores.keys(), key=lambda s: (matched_terms[s], scores[s]), reverse=True)
+        return ranked[:limit]
+
+
+    def __len__(self) -> int:
+        return len(self.set_lengths)
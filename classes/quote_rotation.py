@@ -0,0 +1,54 @@
+import random
+
+
+class QuoteRotation:
+
+    order: list[int]
+    cursor: int
+
+    def __init__(self, order: list[int] | None = None, cursor=0):
+        # order[cursor:] are the sets still to come this cycle
+        self.order = order if order != None else []
+        self.cursor = cursor
+
+
+    def shuffle(self, set_ids: list[int] | set[int]):
+        self.order = list(set_ids)
+        random.shuffle(self.order)
+        self.cursor = 0
+
+
+    def draw(self) -> int | None:
+        if self.cursor >= len(self.order):
+            return None
+        set_id = self.order[self.cursor]
+        self.cursor += 1
+        return set_id
+
+
+    def insert(self, set_id: int) -> list[int]:
+        # a new set takes a random slot among those not drawn yet and the set there moves to the end,
+        # so nothing already shown comes round again; returns the positions that changed
+        self.order.append(set_id)
+        end = len(self.order) - 1
+        position = random.randint(min(self.cursor, end), end)
+        self.order[position], self.order[end] = self.order[end], self.order[position]
+        return sorted(set([position, end]))
+
+
+    def retain(self, set_ids: set[int]) -> bool:
+        # drops sets that no longer exist, keeping the cursor on the same upcoming set; returns whether anything was dropped
+        kept = [set_id for set_id in self.order if set_id in set_ids]
+        if len(kept) == len(self.order):
+            return False
+        self.cursor = len([set_id for set_id in self.order[:self.cursor] if set_id in set_ids])
+        self.order = kept
+        return True
+
+
+    def remaining(self) -> int:
+        return max(0, len(self.order) - self.cursor)
+
+
+    def __len__(self) -> int:
+        return len(self.order)
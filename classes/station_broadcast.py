@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import deque
+
+import discord
+from state import Program
+
+# one 20ms opus frame of silence, played while a listener waits for the station
+OPUS_SILENCE_FRAME = b"\xf8\xff\xfe"
+FRAME_LENGTH = 0.02 # seconds
+
+
+class BroadcastListener(discord.AudioSource):
+
+    _broadcast: object
+    _frames: deque
+    _ended: bool
+
+    def __init__(self, broadcast):
+        self._broadcast = broadcast
+        # bounded, so a listener that falls behind drops old audio instead of growing forever
+        self._frames = deque(maxlen=Program.BROADCAST_LISTENER_BUFFER)
+        self._ended = False
+
+
+    def push(self, packet: bytes):
+        self._frames.append(packet)
+
+
+    def end(self):
+        self._ended = True
+
+
+    def read(self) -> bytes:
+        if len(self._frames) > 0:
+            return self._frames.popleft()
+        # an empty read stops the voice client, so only send one when the station is really gone
+        return b"" if self._ended else OPUS_SILENCE_FRAME
+
+
+    def is_opus(self) -> bool:
+        return True
+
+
+    def cleanup(self):
+        self._broadcast.unsubscribe(self)
+
+
+class StationBroadcast:
+
+    name: str
+    _source: discord.AudioSource
+    _listeners: set[BroadcastListener]
+    _lock: threading.Lock
+    _stopped: threading.Event
+    _thread: threading.Thread | None
+    _on_stopped: object
+
+    def __init__(self, name: str, source: discord.AudioSource, on_stopped=None):
+        # source must produce opus packets; it is read by this object alone and fanned out to every listener.
+        # on_stopped(broadcast) is called from the broadcast's thread once it has shut down
+        self.name = name
+        self._source = source
+        self._on_stopped = on_stopped
+        self._listeners = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+
+    def subscribe(self) -> BroadcastListener | None:
+        with self._lock:
+            if self._stopped.is_set():
+                return None
+            listener = BroadcastListener(self)
+            self._listeners.add(listener)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"broadcast-{self.name}", daemon=True)
+                self._thread.start()
+            Program.log(f"Broadcast '{self.name}' has {len(self._listeners)} listener(s)",0)
+            return listener
+
+
+    def unsubscribe(self, listener: BroadcastListener):
+        with self._lock:
+            self._listeners.discard(listener)
+            remaining = len(self._listeners)
+            if remaining == 0:
+                # stopped under the lock, so a subscribe cannot join a broadcast that is about to end
+                self._stopped.set()
+        Program.log(f"Broadcast '{self.name}' has {remaining} listener(s)",0)
+
+
+    def stop(self):
+        self._stopped.set()
+
+
+    def is_running(self) -> bool:
+        return not self._stopped.is_set()
+
+
+    def get_listener_count(self) -> int:
+        with self._lock:
+            return len(self._listeners)
+
+
+    def _run(self):
+        Program.log(f"Broadcast '{self.name}' started",1)
+        started = time.perf_counter()
+        frames = 0
+        try:
+            while not self._stopped.is_set():
+                packet = self._source.read()
+                if not packet:
+                    break
+                with self._lock:
+                    listeners = list(self._listeners)
+                for listener in listeners:
+                    listener.push(packet)
+
+                # pace to real time like discord's own player, so file sources are not read in one burst
+                frames += 1
+                delay = started + frames * FRAME_LENGTH - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -1:
+                    # the source stalled; start a new schedule rather than bursting to catch up
+                    started = time.perf_counter()
+                    frames = 0
+        except Exception as e:
+            Program.log(f"Broadcast '{self.name}' failed: {repr(e)}",3)
+        finally:
+            self._stopped.set()
+            self._source.cleanup()
+            with self._lock:
+                listeners = list(self._listeners)
+            for listener in listeners:
+                listener.end()
+            Program.log(f"Broadcast '{self.name}' stopped",1)
+            if self._on_stopped is not None:
+                self._on_stopped(self)
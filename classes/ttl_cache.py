@@ -0,0 +1,81 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+
+    max_size: int
+    default_ttl: float | None
+    hits: int
+    misses: int
+    evictions: int
+    _entries: OrderedDict
+
+    def __init__(self, max_size: int, default_ttl: float | None = None):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key, None)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return default
+        # mark as most recently used
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+
+    def set(self, key, value, ttl: float | None = None):
+        ttl = ttl if ttl is not None else self.default_ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+
+    def clear(self):
+        self._entries.clear()
+
+
+    def items(self) -> list[tuple]:
+        # (key, value, seconds left or None) for every live entry, least recently used first
+        now = time.monotonic()
+        return [(k, v, expires_at - now if expires_at is not None else None) for k, (expires_at, v) in self._entries.items() if expires_at is None or expires_at > now]
+
+
+    def __contains__(self, key) -> bool:
+        entry = self._entries.get(key, None)
+        return entry is not None and (entry[0] is None or entry[0] > time.monotonic())
+
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+    def as_dict(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups > 0 else 0.0,
+            "evictions": self.evictions
+        }
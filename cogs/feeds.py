@@ -5,6 +5,8 @@ import os
 from discord.ext import commands
 from classes.parsed_feed import ParsedFeedItem, ParsedFeedHeader
 from classes.feed_subscriber import FeedSubscriber
+from classes.feed_scheduler import FeedScheduler
+from classes.job_scheduler import ScheduledJob
 from classes.text_command import TextCommand
 from state import MessageType, Program, Utility
 
@@ -14,12 +16,18 @@ class FeedCog(commands.Cog):
     _default_channel_type: str
     last_read_date: datetime.datetime
     feed_subscribers: dict[str, FeedSubscriber]
+    _is_loaded: bool
+    _fetch_semaphore: object
+    _parse_executor: object
 
     def __init__(self):
         self._default_channel_type = "rss"
         self._settings_filename = f"{Program.SETTINGS_DIRECTORY_PATH}/{Program.RSS_FEED_SETTINGS_FILE_NAME}"
         self.last_read_date = datetime.datetime.now(datetime.timezone.utc)
         self.feed_subscribers = {}
+        self._is_loaded = False
+        self._fetch_semaphore = None
+        self._parse_executor = None
         
 
     # on startup
@@ -27,9 +35,46 @@ class FeedCog(commands.Cog):
     async def on_ready(self):
         Program.log(f"FeedCog.on_ready(): We have logged in as {Program.bot.user}",0)
 
+        # a reconnect fires on_ready again; keep the feeds (and their learned state) from the first time
+        import asyncio
+        if not self._is_loaded:
+            await self.load_subscribers()
+            self._fetch_semaphore = asyncio.Semaphore(Program.RSS_FEED_FETCH_CONCURRENCY)
+            self._is_loaded = True
+
+        await self.schedule_feeds()
+
+
+    async def schedule_feeds(self):
+        # every feed is its own job; registering again after a reconnect or reload keeps each feed's place instead of adding a second poller
+        import random
+        import time
+        scheduler = Program.get_job_scheduler()
+        now = time.time()
+        for feed_name in self.feed_subscribers.keys():
+            # jobs hold the name, not the subscriber, so a reload that replaces the subscriber objects is picked up on the next poll
+            job = ScheduledJob(f"rss:{feed_name}", lambda name=feed_name: self.poll_feed(name), interval=Program.RSS_FEED_UPDATE_TIMER)
+            # spread the first polls out so startup does not burst
+            await scheduler.add_job(job, first_run=now + random.uniform(0, Program.RSS_FEED_STARTUP_SPREAD))
+        for job_id in scheduler.get_job_ids("rss:"):
+            if not job_id[len("rss:"):] in self.feed_subscribers:
+                scheduler.remove_job(job_id)
+                Program.log(f"Stopped polling removed feed '{job_id[len('rss:'):]}'",1)
+
+
+    async def poll_feed(self, feed_name: str) -> float | None:
+        feed_subscriber = self.feed_subscribers.get(feed_name, None)
+        if feed_subscriber is None:
+            # the feed was removed by a reload since this run was scheduled
+            Program.get_job_scheduler().remove_job(f"rss:{feed_name}")
+            return None
+        return await self.parse_feed(feed_subscriber)
+
+
+    async def load_subscribers(self):
         # load settings
         if Program.use_database:
-            self.load_subscribers_from_database()
+            await self.load_subscribers_from_database()
             Program.log(f"Loaded {len(self.feed_subscribers)} saved RSS feeds from database.",0)
         else:
             if not os.path.exists(Program.SETTINGS_DIRECTORY_PATH):
@@ -48,53 +93,204 @@ class FeedCog(commands.Cog):
         # show rss feeds in console
         Program.log(f"RSS feeds last read {self.last_read_date}",0)
         for n, f in self.feed_subscribers.items():
-            Program.log(f"  {n}: {json.dumps(f.as_dict())}",0)
-
-        # start rss reader cycle
-        await self.rss_watcher()
+            Program.log(f"  {n}: {json.dumps({k: v for k, v in f.as_dict().items() if k != 'seen_items'})} ({len(f.seen_items)} seen items)",0)
+
+
+    async def parse_feed(self, feed_subscriber: FeedSubscriber) -> float:
+        # run by the job scheduler; feeds that come due together are fetched concurrently, bounded by the shared semaphore
+        poll_started = datetime.datetime.now(datetime.timezone.utc)
+        try:
+            (code, headers, feed) = await self.fetch_feed(feed_subscriber, self._fetch_semaphore)
+        except Exception as e:
+            Program.log(f"  Feed '{feed_subscriber.feed_name}' could not be read: {repr(e)}",2)
+            return self.reschedule_feed(feed_subscriber, None, {}, None)
+        next_poll = self.reschedule_feed(feed_subscriber, code, headers, feed)
+        if feed is None:
+            return next_poll
+
+        try:
+            seen_keys = await self.post_new_items(feed_subscriber, feed)
+        except Exception as e:
+            Program.log(f"  Feed '{feed_subscriber.feed_name}' could not be posted: {repr(e)}",3)
+            return next_poll
+
+        # feeds list newest first; record oldest first so the newest keys are the last to be evicted
+        seen_keys.reverse()
+        feed_subscriber.mark_seen(seen_keys)
+        if Program.use_database:
+            try:
+                await self.update_seen_items_to_database(feed_subscriber, seen_keys)
+            except Exception as e:
+                Program.log(f"  Feed '{feed_subscriber.feed_name}' seen items could not be saved: {repr(e)}",3)
+
+        # only remember the validators once the new items went out, otherwise a 304 would hide them forever
+        if feed.etag != feed_subscriber.etag or feed.last_modified != feed_subscriber.last_modified:
+            feed_subscriber.etag = feed.etag
+            feed_subscriber.last_modified = feed.last_modified
+            if Program.use_database:
+                await self.update_validators_to_database(feed_subscriber)
 
+        self.last_read_date = max(self.last_read_date, poll_started)
+        if Program.use_database:
+            await self.write_settings_last_read_date_to_database()
+        else:
+            self.update_subscribers_to_json()
+        return next_poll
+
+
+    def reschedule_feed(self, feed_subscriber: FeedSubscriber, code: int | None, headers: dict, feed: ParsedFeedHeader | None) -> float:
+        import time
+        previous_interval = feed_subscriber.poll_interval or Program.RSS_FEED_UPDATE_TIMER
+        if feed is not None:
+            feed_subscriber.poll_interval = FeedScheduler.get_interval_from_feed(feed)
+            feed_subscriber.skip_hours = feed.skip_hours
+        elif code == 304:
+            # nothing new; ease off gradually
+            feed_subscriber.poll_interval = min(previous_interval * 1.5, Program.RSS_FEED_MAX_POLL_INTERVAL)
+        else:
+            # errors back off exponentially
+            feed_subscriber.poll_interval = min(previous_interval * 2, Program.RSS_FEED_MAX_POLL_INTERVAL)
 
-    async def rss_watcher(self):
-        import asyncio
-        while True:
-            Program.log("Running parse_read() cycle...",0)
-            await self.parse_feed()
-            await asyncio.sleep(Program.RSS_FEED_UPDATE_TIMER)
+        delay = FeedScheduler.add_jitter(feed_subscriber.poll_interval)
+        retry_after = FeedScheduler.parse_retry_after({k.lower(): v for k, v in headers.items()}.get("retry-after", None))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        due = FeedScheduler.skip_to_allowed_hour(time.time() + delay, feed_subscriber.skip_hours)
+        Program.log(f"  Feed '{feed_subscriber.feed_name}' next polled in {round((due - time.time()) / 60)} minutes",0)
+        return due
 
 
-    async def parse_feed(self):
-        # do feed read
+    async def fetch_feed(self, feed_subscriber: FeedSubscriber, semaphore) -> tuple[int, dict, ParsedFeedHeader | None]:
+        import asyncio
+        url = feed_subscriber.feed_url
+        async with semaphore:
+            (body, headers, code) = await asyncio.wait_for(Utility.http_get_raw(url, headers=feed_subscriber.get_conditional_headers(), timeout=Program.RSS_FEED_FETCH_TIMEOUT), timeout=Program.RSS_FEED_FETCH_TIMEOUT)
+        if code == 304:
+            Program.log(f"  Feed '{feed_subscriber.feed_name}' has not changed",0)
+            return (code, headers, None)
+        if not Utility.is_200(code):
+            Program.log(f"  Feed '{feed_subscriber.feed_name}' returned {code}",2)
+            return (code, headers, None)
+
+        # feedparser is pure python and slow on large bodies, so keep it off the event loop
+        feed = await asyncio.get_running_loop().run_in_executor(self.get_parse_executor(), FeedCog.parse_feed_body, body, headers)
+        # header names are case-insensitive; parse_feed saves these on the subscriber once the new items are posted
+        lower_headers = {k.lower(): v for k, v in headers.items()}
+        feed.etag = lower_headers.get("etag", None)
+        feed.last_modified = lower_headers.get("last-modified", None)
+        return (code, headers, feed)
+
+
+    def parse_feed_body(body: bytes, headers: dict) -> ParsedFeedHeader:
         import feedparser
-        for (_, feed_subscriber) in self.feed_subscribers.items():
-            url = feed_subscriber.feed_url
-            feed = ParsedFeedHeader(feedparser.parse(url))
-
-            new_items: list[ParsedFeedItem] = list(filter(lambda x: datetime.datetime.timestamp(x.published) > datetime.datetime.timestamp(self.last_read_date), feed.items))
-            new_items = new_items[0:Program.MAX_NEW_RSS_STORIES_PER_CYCLE] # spam prevention
-            Program.log(f"  Parsing {len(new_items)} items from '{feed.title}'. Published after {self.last_read_date} with timestamp({datetime.datetime.timestamp(self.last_read_date)})",0)
-            for item in new_items:
-                Program.log(f"    Preparing story published {item.published} with timestamp({datetime.datetime.timestamp(item.published)})",0)
-                embed = discord.Embed(
-                    title=f"{feed.title.upper()} --- {item.title}",
-                    color=MessageType.PLAYLIST_ITEM.value,
-                    url=item.link,
-                    description=item.summary)
-                if not Utility.is_null_or_whitespace(feed.image_url):
-                    embed.set_thumbnail(url=feed.image_url)
-                if (len(item.image_urls) > 0):
-                    embed.set_image(url=item.image_urls[0])
-                embed.set_footer(text=f"Published {item.published.strftime('%Y-%m-%d %H:%M:%S')}")
-                
-                for channel_id in feed_subscriber.subscribing_channels:
-                    channel = Program.bot.get_channel(channel_id)
-                    await channel.send(embed=embed)
+        return ParsedFeedHeader(feedparser.parse(body, response_headers={k.lower(): v for k, v in headers.items()}), ParsedFeedHeader.parse_skip_hours(body))
+
+
+    def get_parse_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+        if self._parse_executor is None:
+            self._parse_executor = ThreadPoolExecutor(max_workers=Program.RSS_FEED_FETCH_CONCURRENCY, thread_name_prefix="feedparser")
+        return self._parse_executor
+
+
+    async def post_new_items(self, feed_subscriber: FeedSubscriber, feed: ParsedFeedHeader) -> list[str]:
+        # items come newest first, so everything after the first story we have already handled is old news
+        unseen_items: list[ParsedFeedItem] = []
+        seed_keys: list[str] = []
+        is_first_read = len(feed_subscriber.seen_items) == 0
+        for item in feed.iter_items():
+            if feed_subscriber.has_seen(item.key):
+                break
+            if is_first_read and datetime.datetime.timestamp(item.published) <= datetime.datetime.timestamp(self.last_read_date):
+                # first read of this feed: older stories are not news, but the newest one marks where the next read stops
+                seed_keys.append(item.key)
+                break
+            unseen_items.append(item)
+        new_items = unseen_items[0:Program.MAX_NEW_RSS_STORIES_PER_CYCLE] # spam prevention
+        Program.log(f"  Parsing {len(new_items)} of {len(unseen_items)} unseen items from '{feed.title}'",0)
+        # build each embed once, no matter how many channels it goes to
+        embeds: list[discord.Embed] = []
+        for item in new_items:
+            Program.log(f"    Preparing story published {item.published} with timestamp({datetime.datetime.timestamp(item.published)})",0)
+            embed = discord.Embed(
+                title=f"{feed.title.upper()} --- {item.title}",
+                color=MessageType.PLAYLIST_ITEM.value,
+                url=item.link,
+                description=item.summary)
+            if not Utility.is_null_or_whitespace(feed.image_url):
+                embed.set_thumbnail(url=feed.image_url)
+            if (len(item.image_urls) > 0):
+                embed.set_image(url=item.image_urls[0])
+            embed.set_footer(text=f"Published {item.published.strftime('%Y-%m-%d %H:%M:%S')}")
+            embeds.append(embed)
+
+        if len(embeds) > 0:
+            await self.deliver_embeds(feed_subscriber, embeds)
+        return [item.key for item in unseen_items] + seed_keys
+            
 
-        self.last_read_date = datetime.datetime.now(datetime.timezone.utc)
-        if Program.use_database:
-            self.write_settings_last_read_date_to_database()
-        else:
+    async def deliver_embeds(self, feed_subscriber: FeedSubscriber, embeds: list[discord.Embed]):
+        import asyncio
+        # every channel is its own rate limit route in discord's api (and py-cord waits out 429s per route),
+        # so channels are sent to concurrently while stories within a channel stay in order
+        semaphore = asyncio.Semaphore(Program.RSS_DELIVERY_CONCURRENCY)
+        channel_ids = list(feed_subscriber.subscribing_channels)
+        results = await asyncio.gather(*[self.deliver_to_channel(channel_id, embeds, semaphore) for channel_id in channel_ids], return_exceptions=True)
+
+        dead_channel_ids = []
+        for channel_id, result in zip(channel_ids, results):
+            if isinstance(result, BaseException):
+                Program.log(f"    Delivery of '{feed_subscriber.feed_name}' to {channel_id} failed: {repr(result)}",3)
+            elif result == False:
+                dead_channel_ids.append(channel_id)
+        if len(dead_channel_ids) > 0:
+            await self.prune_dead_channels(feed_subscriber, dead_channel_ids)
+
+
+    async def deliver_to_channel(self, channel_id: int, embeds: list[discord.Embed], semaphore) -> bool:
+        import asyncio
+        channel = Program.bot.get_channel(channel_id)
+        if channel == None:
+            # a channel in an unavailable guild is missing from the cache too; only discord saying it is gone counts as dead
+            try:
+                channel = await Program.bot.fetch_channel(channel_id)
+            except discord.NotFound:
+                return False
+            except (discord.HTTPException, discord.InvalidData) as e:
+                Program.log(f"    Channel {channel_id} is not reachable right now, skipping it this time: {repr(e)}",2)
+                return True
+        for embed in embeds:
+            attempt = 1
+            while True:
+                try:
+                    async with semaphore:
+                        await channel.send(embed=embed)
+                    break
+                except discord.NotFound:
+                    return False
+                except discord.Forbidden:
+                    # the channel still exists, so flag it for a human rather than dropping the subscription
+                    await Program.write_dev_log(f"Missing permission to post RSS stories in {channel.mention} ({channel_id}).")
+                    return True
+                except discord.HTTPException as e:
+                    if e.status < 500 or attempt >= Program.RSS_DELIVERY_ATTEMPTS:
+                        raise
+                    Program.log(f"    Transient {e.status} sending to {channel_id}, retrying ({attempt}/{Program.RSS_DELIVERY_ATTEMPTS-1})...",2)
+                    await asyncio.sleep(2 ** attempt)
+                    attempt += 1
+        return True
+
+
+    async def prune_dead_channels(self, feed_subscriber: FeedSubscriber, channel_ids: list[int]):
+        for channel_id in channel_ids:
+            if channel_id in feed_subscriber.subscribing_channels:
+                feed_subscriber.subscribing_channels.remove(channel_id)
+            if Program.use_database:
+                await self.remove_subscriber_from_database(feed_subscriber.feed_name, channel_id)
+        if not Program.use_database:
             self.update_subscribers_to_json()
-            
+        await Program.write_dev_log(f"Channels {channel_ids} no longer exist and were unsubscribed from `{feed_subscriber.feed_name}`.")
+
 
     # #####################################
     # Commands
@@ -107,9 +303,10 @@ class FeedCog(commands.Cog):
         
         async with context.typing():
             if Program.use_database:
-                self.load_subscribers_from_database()
+                await self.load_subscribers_from_database()
             else:
                 self.load_subscribers_from_json()
+            await self.schedule_feeds()
 
         feed_names = list(map(lambda x: f"{x[1].feed_name}: {x[1].feed_url}", self.feed_subscribers.items()))
         feed_string = '\r\n'.join(feed_names)
@@ -149,7 +346,7 @@ class FeedCog(commands.Cog):
         async with context.typing():
             feed_subscriber.subscribing_channels.append(channel_id)
             if Program.use_database:
-                self.update_subscriber_to_database(feed_subscriber.feed_name, channel_id)
+                await self.update_subscriber_to_database(feed_subscriber.feed_name, channel_id)
             else:
                 self.update_subscribers_to_json()
 
@@ -190,7 +387,7 @@ class FeedCog(commands.Cog):
         async with context.typing():
             feed_subscriber.subscribing_channels.remove(channel_id)
             if Program.use_database:
-                self.remove_subscriber_from_database(feed_subscriber.feed_name, channel_id)
+                await self.remove_subscriber_from_database(feed_subscriber.feed_name, channel_id)
             else:
                 self.update_subscribers_to_json()
 
@@ -218,45 +415,72 @@ class FeedCog(commands.Cog):
             from dateutil import parser
             settings = json.load(file)
             self.last_read_date = parser.parse(settings.get("last_read", datetime.datetime.now(datetime.timezone.utc).isoformat()))
-            feed_subscribers = settings.get("feed_subscribers", [])
-            self.feed_subscribers = {}
-            for fs in feed_subscribers:
+            # built aside and swapped in whole, like the database load
+            feed_subscribers: dict[str, FeedSubscriber] = {}
+            for fs in settings.get("feed_subscribers", []):
                 feed_name = fs.get("feed_name", None)
                 if feed_name != None:
-                    self.feed_subscribers[feed_name] = FeedSubscriber(
+                    feed_subscribers[feed_name] = FeedSubscriber(
                         fs.get("feed_name", "name"),
                         fs.get("feed_url", "about:blank"),
-                        fs.get("subscribing_channels", [])
+                        fs.get("subscribing_channels", []),
+                        fs.get("etag", None),
+                        fs.get("last_modified", None),
+                        fs.get("seen_items", [])
                     )
                 else:
                     Program.log(f"Invalid FeedSubscriber from file: {feed_name}",2)
+            self.feed_subscribers = feed_subscribers
             Program.log(f"Loaded {self._settings_filename}",0)
                 
 
-    def update_subscriber_to_database(self, feed_name: str, channel_id: int):
-        return Program.call_procedure_return_scalar("subscribe_to_rss_feed", (feed_name, channel_id))
+    async def update_subscriber_to_database(self, feed_name: str, channel_id: int):
+        return await Program.call_procedure_return_scalar("subscribe_to_rss_feed", (feed_name, channel_id))
+    
+
+    async def remove_subscriber_from_database(self, feed_name: str, channel_id: int):
+        return await Program.call_procedure_return_scalar("unsubscribe_to_rss_feed", (feed_name, channel_id))
     
 
-    def remove_subscriber_from_database(self, feed_name: str, channel_id: int):
-        return Program.call_procedure_return_scalar("unsubscribe_to_rss_feed", (feed_name, channel_id))
+    async def update_validators_to_database(self, feed_subscriber: FeedSubscriber):
+        return await Program.call_procedure_return_scalar("update_rss_feed_validators", (feed_subscriber.feed_name, feed_subscriber.etag, feed_subscriber.last_modified))
     
 
-    def load_subscribers_from_database(self):
-        feeds_rows = Program.run_query_return_rows("SELECT unique_name, url FROM discord.rss_feeds")
-        self.feed_subscribers.clear()
-        for unique_name, url in feeds_rows:
-            self.feed_subscribers[unique_name] = FeedSubscriber(unique_name, url, [])
+    async def update_seen_items_to_database(self, feed_subscriber: FeedSubscriber, item_keys: list[str]):
+        if len(item_keys) == 0:
+            return 0
+        rows = [(feed_subscriber.database_id, item_key) for item_key in item_keys]
+        # not INSERT IGNORE: the pool raises on warnings, and a skipped duplicate is a warning that rolls back the whole batch
+        result = await Program.run_statement_return_rowcount("INSERT INTO discord.rss_feed_seen_items (rss_feed_id, item_key, seen_at) VALUES (%s, %s, NOW()) ON DUPLICATE KEY UPDATE seen_at=NOW()", rows, many=True)
+        # keep the table bounded the same way the in-memory index is
+        await Program.run_statement_return_rowcount(
+            "DELETE FROM discord.rss_feed_seen_items WHERE rss_feed_id=%s AND id < (SELECT id FROM (SELECT id FROM discord.rss_feed_seen_items WHERE rss_feed_id=%s ORDER BY id DESC LIMIT 1 OFFSET %s) AS cutoff)",
+            (feed_subscriber.database_id, feed_subscriber.database_id, Program.RSS_FEED_SEEN_ITEMS_LIMIT - 1))
+        return result
+    
+
+    async def load_subscribers_from_database(self):
+        # built aside and swapped in whole, so a poll running during these queries never sees a half-loaded feed
+        feed_subscribers: dict[str, FeedSubscriber] = {}
+        feeds_rows = await Program.run_query_return_rows("SELECT id, unique_name, url, etag, last_modified FROM discord.rss_feeds")
+        for feed_id, unique_name, url, etag, last_modified in feeds_rows:
+            feed_subscribers[unique_name] = FeedSubscriber(unique_name, url, [], etag, last_modified, database_id=feed_id)
+
+        seen_rows = await Program.run_query_return_rows("SELECT f.unique_name, s.item_key FROM discord.rss_feed_seen_items AS s JOIN discord.rss_feeds AS f ON s.rss_feed_id=f.id ORDER BY s.id")
+        for unique_name, item_key in seen_rows:
+            feed_subscribers.get(unique_name).mark_seen([item_key])
 
-        subscribers_rows = Program.run_query_return_rows("SELECT f.unique_name, s.channel_id FROM discord.rss_feed_subscribers AS s LEFT JOIN discord.rss_feeds AS f ON s.rss_feed_id=f.id")
+        subscribers_rows = await Program.run_query_return_rows("SELECT f.unique_name, s.channel_id FROM discord.rss_feed_subscribers AS s LEFT JOIN discord.rss_feeds AS f ON s.rss_feed_id=f.id")
         for unique_name, channel_id in subscribers_rows:
-            self.feed_subscribers.get(unique_name).subscribing_channels.append(channel_id)
+            feed_subscribers.get(unique_name).subscribing_channels.append(channel_id)
+        self.feed_subscribers = feed_subscribers
 
-        settings_rows = Program.run_query_return_rows("SELECT * FROM discord.settings")
+        settings_rows = await Program.run_query_return_rows("SELECT * FROM discord.settings")
         for name, value in settings_rows:
             if name == "last_read_date":
                 self.last_read_date = datetime.datetime.fromisoformat(value)
                 Program.log(f"Parsed '{value}' to [{self.last_read_date}] from database")
 
 
-    def write_settings_last_read_date_to_database(self):
-        return Program.call_procedure_return_scalar("insert_or_update_settings", ("last_read_date", str(self.last_read_date)))
+    async def write_settings_last_read_date_to_database(self):
+        return await Program.call_procedure_return_scalar("insert_or_update_settings", ("last_read_date", str(self.last_read_date)))
@@ -1,21 +1,40 @@
+import asyncio
 import datetime
 import json
 import os
+import time
 import discord
+from urllib.parse import urlparse
 from discord.ext import commands
+from classes.guild_instance import GuildInstance
+from classes.job_scheduler import ScheduledJob
+from classes.media_library import LibraryTrack, MediaLibrary
 from classes.radio_station import RadioStation
+from classes.station_broadcast import BroadcastListener, StationBroadcast
 from classes.text_command import TextCommand
+from classes.ttl_cache import TTLCache
 from state import Program, Utility
 
 class MediaCog(commands.Cog):
     _default_channel_type: str
     _settings_filename: str
+    _media_cache_filename: str
     radio_stations: dict[str, RadioStation]
+    broadcasts: dict[str, StationBroadcast]
+    probe_cache: TTLCache
+    url_cache: TTLCache
+    media_library: MediaLibrary | None
 
     def __init__(self):
         self._default_channel_type = "jukebox"
         self._settings_filename = f"{Program.SETTINGS_DIRECTORY_PATH}/{Program.RADIO_STATIONS_FILE_NAME}"
+        self._media_cache_filename = f"{Program.SETTINGS_DIRECTORY_PATH}/{Program.MEDIA_CACHE_FILE_NAME}"
         self.radio_stations = {}
+        self.broadcasts = {}
+        # both keyed on the station url as configured, so editing a station's url starts it fresh
+        self.probe_cache = TTLCache(Program.MEDIA_CACHE_MAX_ENTRIES, Program.MEDIA_PROBE_CACHE_TTL)
+        self.url_cache = TTLCache(Program.MEDIA_CACHE_MAX_ENTRIES, Program.MEDIA_URL_CACHE_TTL)
+        self.media_library = None
             
 
     @commands.Cog.listener()
@@ -23,7 +42,7 @@ class MediaCog(commands.Cog):
         Program.log(f"MediaCog.on_ready(): We have logged in as {Program.bot.user}",0)
 
         if Program.use_database:
-            self.load_radio_stations_from_database()
+            await self.load_radio_stations_from_database()
             Program.log(f"Loaded {len(self.radio_stations)} saved radio stations from database.",0)
         else:
             if not os.path.exists(Program.SETTINGS_DIRECTORY_PATH):
@@ -43,50 +62,128 @@ class MediaCog(commands.Cog):
         for n, r in self.radio_stations.items():
             Program.log(f"  {n}: {json.dumps(r.as_dict())}",0)
 
+        if Program.MEDIA_CACHE_PERSIST and os.path.exists(self._media_cache_filename):
+            self.load_media_cache_from_json()
+
+        # the local library is indexed in the background; requests only ever read the index
+        library_path = os.getenv("MEDIA_LIBRARY_PATH")
+        if self.media_library == None and not Utility.is_null_or_whitespace(library_path):
+            if not os.path.isdir(library_path):
+                Program.log(f"MEDIA_LIBRARY_PATH '{library_path}' is not a directory; the media library is disabled.",2)
+            else:
+                self.media_library = MediaLibrary(library_path)
+                self.media_library.load_index_from_json()
+                await Program.get_job_scheduler().add_job(ScheduledJob("media_library_scan", self.media_library.scan, interval=Program.MEDIA_LIBRARY_SCAN_INTERVAL), first_run=time.time())
+
 
     # #####################################
     # Commands
     # #####################################
 
-    @commands.command(name="stream", aliases=["listen", "queue", "play"], hidden=False, 
+    @commands.command(name="stream", aliases=["listen", "play"], hidden=False, 
         brief="Play some media",
         usage=f"[preset_name] ... NOTE: use preset command to get the list of available media")
     async def command_stream(self, context: commands.Context):
         if not Utility.is_valid_command_context(context, channel_type=self._default_channel_type, is_global_command=False, is_whisper_command=False):
             return
         
-        # Get the requested radio station name
         command = TextCommand(context)
-        preset_name = command.get_part(1)
-        if not preset_name in self.radio_stations.keys():
-            await context.reply(f"`{preset_name}` is not a media preset.")
-            return
-        
-        # Get the radio station url
-        radio_station = self.radio_stations.get(preset_name, None)
-        protocol = radio_station.url.split('://')[0].lower()
-        if not protocol in Program.WHITELISTED_PROTOCOLS:
-            await context.reply(f"Bad input. Must be a protocol in `{', '.join(Program.WHITELISTED_PROTOCOLS)}`")
-            return
-        
-        # Find target voice channel
-        voice_channel = context.author.voice.channel
-        if voice_channel == None:
-            await context.reply("You must be in a voice channel")
+        radio_station = await self.get_requested_station(context, command.get_part(1))
+        if radio_station == None:
             return
         
         async with context.typing():
-            if context.voice_client and context.voice_client.is_playing():
+            # jump the queue; whatever was playing stops and the player's callback starts this next
+            guild_instance = self.get_guild_instance(context.guild)
+            if not guild_instance.enqueue(radio_station, at_front=True):
+                await context.reply(f"The queue is full ({Program.MEDIA_QUEUE_LIMIT} items). Use `{Program.command_character}queue clear` first.")
+                return
+            await self.join(context, context.author.voice.channel)
+            if context.voice_client.is_playing():
                 Program.log(f"Voice client in {context.guild.name} is already playing auto. Stopping to play another...",1)
                 context.voice_client.stop()
-
-            # Find the media and play
-            source = await self.get_stream_from_path(radio_station.url)
-            await self.join(context, voice_channel)
-            context.voice_client.play(source, after=lambda e: Program.log(f"Media Player error: {e}",3) if e else None)
+            else:
+                await self.play_next(context.guild.id)
         await context.send(f"Now playing: `{radio_station.display_name}`")
 
 
+    @commands.command(name="queue", hidden=False, 
+        brief="Queue up media to play next",
+        usage=f"[preset_name] OR <list> OR <skip> OR <clear>")
+    async def command_queue(self, context: commands.Context):
+        if not Utility.is_valid_command_context(context, channel_type=self._default_channel_type, is_global_command=False, is_whisper_command=False):
+            return
+
+        command = TextCommand(context)
+        guild_instance = self.get_guild_instance(context.guild)
+        match command.get_part(1):
+            case "" | "list" | "l":
+                lines = [f"{i}. {m.display_name}" for i, m in enumerate(guild_instance.queued_media, start=1)]
+                now_playing = guild_instance.now_playing.display_name if guild_instance.now_playing != None and context.voice_client != None else "nothing"
+                queue_string = "\n".join(lines) if len(lines) > 0 else "The queue is empty."
+                await context.send(f"**Now playing:** `{now_playing}`\n```{queue_string} ```")
+
+            case "skip" | "s" | "next" | "n":
+                if context.voice_client == None or not context.voice_client.is_playing():
+                    await context.reply(f"Nothing is playing.")
+                    return
+                # stopping runs the player's callback, which starts the next item
+                context.voice_client.stop()
+                await context.send(f"Skipped `{guild_instance.now_playing.display_name if guild_instance.now_playing != None else 'the current media'}`.")
+
+            case "clear" | "c":
+                guild_instance.clear_queue()
+                await context.send(f"Cleared the queue.")
+
+            case _:
+                preset_name = command.get_part(2) if command.get_part(1) in ["add", "a"] else command.get_part(1)
+                radio_station = await self.get_requested_station(context, preset_name)
+                if radio_station == None:
+                    return
+                await self.enqueue_and_play(context, radio_station)
+
+
+    @commands.command(name="library", aliases=["lib"], hidden=False, 
+        brief="Play tracks from the local media library",
+        usage=f"[track name] OR <search [track name]> OR <rescan>")
+    async def command_library(self, context: commands.Context):
+        if not Utility.is_valid_command_context(context, channel_type=self._default_channel_type, is_global_command=False, is_whisper_command=False):
+            return
+        if self.media_library == None:
+            await context.reply(f"There is no local media library on this bot.")
+            return
+
+        command = TextCommand(context)
+        match command.get_part(1):
+            case "":
+                await context.reply(f"The library has {len(self.media_library)} tracks. `{Program.command_character}library search [track name]` to look for one.")
+
+            case "search" | "s" | "find" | "f":
+                tracks = await self.media_library.find(command.get_command_from(2), Program.MEDIA_LIBRARY_RESULT_LIMIT)
+                if len(tracks) == 0:
+                    await context.reply(f"No tracks matched `{command.get_command_from(2)}`.")
+                    return
+                track_string = "\n".join([f"{i}. {t.display_name}" for i, t in enumerate(tracks, start=1)])
+                await context.send(f"**Matching tracks:**\n```{track_string} ```")
+
+            case "rescan":
+                if context.author.id != Program.owner_admin_id:
+                    return
+                async with context.typing():
+                    await self.media_library.scan()
+                await context.reply(f"Rescanned the library: {len(self.media_library)} tracks.")
+
+            case _:
+                tracks = await self.media_library.find(command.get_command_from(1), 1)
+                if len(tracks) == 0:
+                    await context.reply(f"No tracks matched `{command.get_command_from(1)}`.")
+                    return
+                if context.author.voice == None or context.author.voice.channel == None:
+                    await context.reply("You must be in a voice channel")
+                    return
+                await self.enqueue_and_play(context, tracks[0])
+
+
     @commands.command(name="stop", hidden=False, brief="Stop and disconnect radio station")
     async def command_stop(self, context: commands.Context):
         if not Utility.is_valid_command_context(context, channel_type=self._default_channel_type, is_global_command=True, is_whisper_command=False):
@@ -94,6 +191,9 @@ class MediaCog(commands.Cog):
         
         if context.voice_client != None:
             Program.log(f"Voice client in {context.guild.name} is already playing auto. Stopping to play another...",1)
+            guild_instance = self.get_guild_instance(context.guild)
+            guild_instance.clear_queue()
+            guild_instance.now_playing = None
             context.voice_client.stop()
             await context.voice_client.disconnect()
             await context.send(f"Turning off the radio station...")
@@ -110,7 +210,7 @@ class MediaCog(commands.Cog):
         if command.get_part(1) == "reload":
             async with context.typing():
                 if Program.use_database:
-                    self.load_radio_stations_from_database()
+                    await self.load_radio_stations_from_database()
                 else:
                     self.load_radio_stations_from_json()
 
@@ -123,22 +223,255 @@ class MediaCog(commands.Cog):
     # Helper Functions
     # #########################
 
+    async def get_requested_station(self, context: commands.Context, preset_name: str) -> RadioStation | None:
+        # replies with the reason and returns None when the station cannot be played for this user
+        if not preset_name in self.radio_stations.keys():
+            await context.reply(f"`{preset_name}` is not a media preset.")
+            return None
+        
+        radio_station = self.radio_stations.get(preset_name, None)
+        protocol = radio_station.url.split('://')[0].lower()
+        if not protocol in Program.WHITELISTED_PROTOCOLS:
+            await context.reply(f"Bad input. Must be a protocol in `{', '.join(Program.WHITELISTED_PROTOCOLS)}`")
+            return None
+        
+        if context.author.voice == None or context.author.voice.channel == None:
+            await context.reply("You must be in a voice channel")
+            return None
+        return radio_station
+
+
+    async def enqueue_and_play(self, context: commands.Context, media):
+        # starts playing straight away when the guild is idle, otherwise waits its turn
+        guild_instance = self.get_guild_instance(context.guild)
+        if not guild_instance.enqueue(media):
+            await context.reply(f"The queue is full ({Program.MEDIA_QUEUE_LIMIT} items).")
+            return
+
+        async with context.typing():
+            await self.join(context, context.author.voice.channel)
+            if context.voice_client.is_playing():
+                await self.prefetch_next(guild_instance)
+                await context.send(f"Queued `{media.display_name}` at position {len(guild_instance.queued_media)}.")
+                return
+            await self.play_next(context.guild.id)
+        await context.send(f"Now playing: `{media.display_name}`")
+
+
+    def get_guild_instance(self, guild: discord.Guild) -> GuildInstance:
+        guild_instance = Program.guild_instances.get(guild.id, None)
+        if guild_instance == None:
+            guild_instance = GuildInstance(guild.id)
+            Program.guild_instances[guild.id] = guild_instance
+        return guild_instance
+
+
+    async def play_next(self, guild_id):
+        guild = Program.bot.get_guild(guild_id)
+        if guild == None:
+            return
+        guild_instance = self.get_guild_instance(guild)
+        async with guild_instance.playback_lock:
+            voice_client = guild.voice_client
+            if voice_client == None or voice_client.is_playing():
+                return
+            (media, source) = guild_instance.pop_next()
+            guild_instance.now_playing = media
+            if media == None:
+                return
+
+            if source == None:
+                try:
+                    source = await self.get_source(media)
+                except Exception as e:
+                    Program.log(f"Could not start `{media.display_name}` in {guild.name}: {repr(e)}",2)
+                    guild_instance.now_playing = None
+                    source = None
+            else:
+                Program.log(f"Starting prefetched `{media.display_name}` in {guild.name}",0)
+
+            # opening the source can take seconds; the bot may have left voice or started playing in the meantime
+            voice_client = guild.voice_client
+            if source != None and (voice_client == None or voice_client.is_playing()):
+                source.cleanup()
+                guild_instance.now_playing = None
+                return
+            if source != None:
+                try:
+                    voice_client.play(source, after=lambda e: self.on_playback_finished(guild_id, e))
+                except discord.ClientException as e:
+                    Program.log(f"Could not play `{media.display_name}` in {guild.name}: {repr(e)}",2)
+                    source.cleanup()
+                    guild_instance.now_playing = None
+                    return
+
+        if source == None:
+            # this item could not be opened; move on to the one after it
+            await self.play_next(guild_id)
+            return
+        # warm up whatever is next while this one plays
+        await self.prefetch_next(guild_instance)
+
+
+    def on_playback_finished(self, guild_id, error):
+        # runs on the voice player's thread; hand the next track back to the event loop
+        if error:
+            Program.log(f"Media Player error: {error}",3)
+        future = asyncio.run_coroutine_threadsafe(self.play_next(guild_id), Program.bot.loop)
+        future.add_done_callback(self.log_playback_failure)
+
+
+    def log_playback_failure(self, future):
+        # nothing awaits the future, so without this a failure would silently stall the queue
+        if not future.cancelled() and future.exception() is not None:
+            Program.log(f"Could not start the next queued media: {repr(future.exception())}",3)
+
+
+    async def prefetch_next(self, guild_instance: GuildInstance):
+        media = guild_instance.get_prefetch_target()
+        if media == None:
+            return
+        try:
+            source = await self.get_source(media)
+        except Exception as e:
+            Program.log(f"Could not prefetch `{media.display_name}`: {repr(e)}",2)
+            return
+        guild_instance.set_prefetched(media, source)
+
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
+        # being kicked or disconnected skips the stop command, so drop the queue and its warmed source here too
+        if member.id != Program.bot.user.id or before.channel == None or after.channel != None:
+            return
+        guild_instance = Program.guild_instances.get(member.guild.id, None)
+        if guild_instance != None:
+            guild_instance.clear_queue()
+            guild_instance.now_playing = None
+
+
     async def join(self, ctx: commands.Context, channel: discord.VoiceChannel):
         if ctx.voice_client is not None:
             return await ctx.voice_client.move_to(channel)
         await channel.connect()
 
 
-    async def get_stream_from_path(self, source_string: str, is_opus=False):
-        protocol = source_string.split('://')[0].lower()
-        if protocol == Program.FILE_PROTOCOL_PREFIX:
-            return discord.FFmpegPCMAudio(source=source_string[len(Program.FILE_PROTOCOL_PREFIX):])
-        else:
-            if is_opus:
-                return await discord.FFmpegOpusAudio.from_probe(source_string, **Program.FFMPEG_OPTIONS, method='fallback')
-            else:
-                return discord.FFmpegPCMAudio(source=source_string, **Program.FFMPEG_OPTIONS)
-            
+    async def get_source(self, media) -> discord.AudioSource:
+        if isinstance(media, LibraryTrack):
+            return self.get_opus_stream_from_track(media)
+        return await self.get_broadcast_listener(media)
+
+
+    def get_opus_stream_from_track(self, track: LibraryTrack) -> discord.AudioSource:
+        # library files get their own ffmpeg, since a shared broadcast would start late listeners mid-track;
+        # the codec comes from the index, so nothing is probed at request time
+        if track.codec in ("opus", "libopus"):
+            return discord.FFmpegOpusAudio(source=track.path, codec=track.codec, options="-vn")
+        return discord.FFmpegOpusAudio(source=track.path, options=Program.FFMPEG_OPTIONS["options"])
+
+
+    async def get_broadcast_listener(self, radio_station: RadioStation) -> BroadcastListener:
+        # the broadcast starts with its first listener and stops itself when the last one leaves
+        broadcast = self.broadcasts.get(radio_station.name, None)
+        listener = broadcast.subscribe() if broadcast is not None else None
+        if listener is None:
+            source = await self.get_opus_stream_from_station(radio_station)
+            broadcast = StationBroadcast(radio_station.name, source, on_stopped=self.on_broadcast_stopped)
+            self.broadcasts[radio_station.name] = broadcast
+            listener = broadcast.subscribe()
+        return listener
+
+
+    def on_broadcast_stopped(self, broadcast: StationBroadcast):
+        # runs on the broadcast's thread; the dict belongs to the event loop
+        try:
+            Program.bot.loop.call_soon_threadsafe(self.forget_broadcast, broadcast)
+        except RuntimeError:
+            # the loop is already closed during shutdown
+            pass
+
+
+    def forget_broadcast(self, broadcast: StationBroadcast):
+        # a newer broadcast for the same station may already have taken its place
+        if self.broadcasts.get(broadcast.name, None) is broadcast:
+            del self.broadcasts[broadcast.name]
+
+
+    async def get_opus_stream_from_station(self, radio_station: RadioStation):
+        # always opus out, since the packets are sent as-is to every listening guild
+        path = await self.resolve_stream_url(radio_station)
+        is_file = path.split('://')[0].lower() == Program.FILE_PROTOCOL_PREFIX
+        if is_file:
+            path = path.split('://', 1)[1]
+
+        # stations marked as opus are probed once; a real opus stream is remuxed into voice packets without decoding
+        if radio_station.is_opus:
+            probe_result = await self.probe_station(radio_station, path)
+            codec = probe_result.get("codec", None) if probe_result is not None else None
+            if codec in ("opus", "libopus"):
+                # no volume filter here: a filter would force the decode and encode this path exists to avoid
+                before_options = None if is_file else Program.FFMPEG_OPTIONS["before_options"]
+                # FFmpegOpusAudio turns an opus codec argument into "-c:a copy"
+                return discord.FFmpegOpusAudio(source=path, bitrate=probe_result.get("bitrate", None) or 128, codec=codec, before_options=before_options, options="-vn")
+            Program.log(f"Station '{radio_station.name}' is marked as opus but probed as '{codec}'; transcoding instead.",2)
+
+        # everything else is decoded and encoded to opus inside ffmpeg
+        if is_file:
+            return discord.FFmpegOpusAudio(source=path)
+        return discord.FFmpegOpusAudio(source=path, **Program.FFMPEG_OPTIONS)
+
+
+    async def resolve_stream_url(self, radio_station: RadioStation) -> str:
+        # video and music sites hand out short-lived direct media urls; everything else is played as configured
+        if not (urlparse(radio_station.url).hostname or "").lower() in Program.YTDL_HOSTS:
+            return radio_station.url
+        resolved_url = self.url_cache.get(radio_station.url)
+        if resolved_url is not None:
+            return resolved_url
+
+        def extract() -> str | None:
+            import youtube_dl
+            with youtube_dl.YoutubeDL(Program.YTDL_OPTIONS) as ydl:
+                info = ydl.extract_info(radio_station.url, download=False)
+            if "entries" in info:
+                info = next(iter(info["entries"]), {})
+            return info.get("url", None)
+
+        try:
+            resolved_url = await asyncio.to_thread(extract)
+        except Exception as e:
+            Program.log(f"Could not resolve station '{radio_station.name}': {repr(e)}",2)
+            return radio_station.url
+        if resolved_url is None:
+            return radio_station.url
+        self.url_cache.set(radio_station.url, resolved_url)
+        self.write_media_cache_to_json()
+        return resolved_url
+
+
+    async def probe_station(self, radio_station: RadioStation, path: str) -> dict | None:
+        probe_result = self.probe_cache.get(radio_station.url)
+        if probe_result is not None:
+            return probe_result
+        probe = await Utility.ffprobe(path)
+        if probe is None:
+            Program.log(f"Could not probe station '{radio_station.name}'",2)
+            return None
+
+        streams = probe.get("streams", [])
+        stream = streams[0] if len(streams) > 0 else {}
+        container = probe.get("format", {})
+        bitrate = str(stream.get("bit_rate", None) or container.get("bit_rate", ""))
+        probe_result = {
+            "codec": stream.get("codec_name", None),
+            "bitrate": round(int(bitrate) / 1000) if bitrate.isdigit() else None,
+            "container": container.get("format_name", None)
+        }
+        self.probe_cache.set(radio_station.url, probe_result)
+        self.write_media_cache_to_json()
+        Program.log(f"Probed station '{radio_station.name}': {probe_result}",0)
+        return probe_result
+
 
     # #########################
     # I/O functions
@@ -165,12 +498,42 @@ class MediaCog(commands.Cog):
             Program.log(f"Loaded {self._settings_filename}",0)
 
 
-    def update_radio_station_to_database(self, name: str, display_name: str, url: str, opus: bool):
-        return Program.call_procedure_return_scalar("insert_or_update_radio_station", (name, display_name, url, opus))
+    def write_media_cache_to_json(self):
+        # expiry is written as wall-clock time so the entries keep their remaining lifetime across restarts
+        if not Program.MEDIA_CACHE_PERSIST:
+            return
+        now = time.time()
+        data = {
+            "probes": [[k, v, now + ttl if ttl is not None else None] for k, v, ttl in self.probe_cache.items()],
+            "urls": [[k, v, now + ttl if ttl is not None else None] for k, v, ttl in self.url_cache.items()]
+        }
+        if not os.path.exists(Program.SETTINGS_DIRECTORY_PATH):
+            os.makedirs(Program.SETTINGS_DIRECTORY_PATH)
+        with open(self._media_cache_filename, "w") as file:
+            json.dump(data, file, indent=4)
+
+
+    def load_media_cache_from_json(self):
+        now = time.time()
+        try:
+            with open(self._media_cache_filename) as file:
+                data = json.load(file)
+        except ValueError:
+            Program.log(f"Ignoring unreadable {self._media_cache_filename}",2)
+            return
+        for cache, entries in [(self.probe_cache, data.get("probes", [])), (self.url_cache, data.get("urls", []))]:
+            for key, value, expires_at in entries:
+                if expires_at is None or expires_at > now:
+                    cache.set(key, value, expires_at - now if expires_at is not None else None)
+        Program.log(f"Loaded {len(self.probe_cache)} probe result(s) and {len(self.url_cache)} stream url(s) from {self._media_cache_filename}",0)
+
+
+    async def update_radio_station_to_database(self, name: str, display_name: str, url: str, opus: bool):
+        return await Program.call_procedure_return_scalar("insert_or_update_radio_station", (name, display_name, url, opus))
     
 
-    def load_radio_stations_from_database(self):
-        rows = Program.run_query_return_rows("SELECT unique_name, display_name, url, is_opus FROM radio_stations")
+    async def load_radio_stations_from_database(self):
+        rows = await Program.run_query_return_rows("SELECT unique_name, display_name, url, is_opus FROM radio_stations")
         self.radio_stations.clear()
         for unique_name, display_name, url, is_opus in rows:
             self.radio_stations[unique_name] = RadioStation(unique_name, display_name, url, is_opus)
@@ -22,7 +22,7 @@ class PrimaryCog(commands.Cog):
         Program.log(f"MainCog.on_ready(): We have logged in as {Program.bot.user}",0)
 
         if Program.use_database:
-            self.load_guilds_from_database()
+            await self.load_guilds_from_database()
             Program.log(f"Loaded {len(Program.guild_instances)} saved guild(s) from database.",0)
         else:
             # make the settings directory if it does not exist
@@ -106,7 +106,7 @@ class PrimaryCog(commands.Cog):
 
             # save change to disk
             if Program.use_database:
-                result = self.update_guilds_to_database(guild_id, channel_type, channel_id)
+                result = await self.update_guilds_to_database(guild_id, channel_type, channel_id)
                 if result != 1:
                     await context.reply(f"Something went wrong ({result})")
                     Program.log(f"Something went wrong ({result})",3)
@@ -146,6 +146,18 @@ class PrimaryCog(commands.Cog):
         await context.reply(f"pong\n```{datetime.datetime.now().timestamp() - context.message.created_at.timestamp()} ms```")
 
 
+    @commands.command(name="stats", hidden=True, brief="Show internal health counters")
+    async def command_stats(self, context: commands.Context):
+        if not Utility.is_valid_command_context(context, channel_type=self._default_channel_type, is_global_command=True, is_whisper_command=True):
+            return
+        if context.author.id != Program.owner_admin_id:
+            return
+
+        database_string = "\n".join(map(lambda x: f"{x[0]}: {x[1]}", Program.get_database_stats().items()))
+        http_cache_string = "\n".join(map(lambda x: f"{x[0]}: {x[1]}", Program.get_http_cache().as_dict().items()))
+        await context.reply(f"**Database**\n```{database_string}```\n**HTTP cache**\n```{http_cache_string}```")
+
+
     @commands.command(name="cls", hidden=True, 
         brief="Delete and archive all messages in this channel",
         usage="(--output=[yes|no])",
@@ -236,12 +248,12 @@ class PrimaryCog(commands.Cog):
                 Program.guild_instances[guild_id] = guild_instance
 
 
-    def update_guilds_to_database(self, guild_id, channel_type, channel_id):
-        return Program.call_procedure_return_scalar("insert_or_update_guild_channel", (guild_id, channel_type, channel_id))
+    async def update_guilds_to_database(self, guild_id, channel_type, channel_id):
+        return await Program.call_procedure_return_scalar("insert_or_update_guild_channel", (guild_id, channel_type, channel_id))
     
 
-    def load_guilds_from_database(self):
-        rows = Program.run_query_return_rows("SELECT guild_id, channel_type, channel_id FROM guild_channels")
+    async def load_guilds_from_database(self):
+        rows = await Program.run_query_return_rows("SELECT guild_id, channel_type, channel_id FROM guild_channels")
         for guild_id, channel_type, channel_id in rows:
             if Program.guild_instances.get(guild_id):
                 Program.guild_instances[guild_id].set_channel_type(channel_type, channel_id)
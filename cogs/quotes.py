@@ -3,64 +3,103 @@ import datetime
 import math
 import discord
 from discord.ext import commands
+from classes.job_scheduler import ScheduledJob
 from classes.quote import Quote
+from classes.quote_index import QuoteIndex
+from classes.quote_rotation import QuoteRotation
+from classes.ttl_cache import TTLCache
 from classes.text_command import TextCommand
 from state import Program, Utility
 
 class QuoteCog(commands.Cog):
 
     _default_channel_type: str
+    guild_set_ids: dict[int, set[int]]
+    guild_quote_indexes: dict[int, QuoteIndex]
+    guild_rendered_sets: dict[int, TTLCache]
+    guild_rotations: dict[int, QuoteRotation]
 
     def __init__(self):
         self._default_channel_type = "command"
+        self.guild_set_ids = {}
+        self.guild_quote_indexes = {}
+        self.guild_rendered_sets = {}
+        self.guild_rotations = {}
 
 
     @commands.Cog.listener()
     async def on_ready(self):
         Program.log(f"Quotes.on_ready(): We have logged in as {Program.bot.user}",0)
-        while True:
-            # get seconds to next qotd time
-            now = datetime.datetime.now()
-            seconds_to_first_message = (datetime.datetime.combine(now + datetime.timedelta(days=1), datetime.time(hour=8)) - now).seconds
-            Program.log(f"QotD message will occur in {math.floor(seconds_to_first_message/60)} minutes.",0)
-            await asyncio.sleep(seconds_to_first_message)
-
-            # do qotd
-            Program.log(f"Sending quote of the day now!",0)
-            guild_channel_rows = Program.run_query_return_rows("SELECT guild_id, channel_id FROM discord.qotd_subscription", ())
-            for guild_id, channel_id in guild_channel_rows:
-                await self.run_qotd(guild_id, channel_id)
-
-            # wait for time to pass
-            await asyncio.sleep(120)
+        # on_ready fires again after a reconnect; the scheduler keeps a single "qotd" job however often it is registered
+        scheduler = Program.get_job_scheduler()
+        await scheduler.add_job(ScheduledJob("qotd", self.dispatch_qotd, daily_at=datetime.time(hour=Program.QOTD_HOUR_OF_DAY), persist=True, catch_up=True))
+        next_run = datetime.datetime.fromtimestamp(scheduler.get_next_run("qotd"))
+        Program.log(f"QotD message will occur at {next_run} ({math.floor((next_run - datetime.datetime.now()).total_seconds()/60)} minutes).",0)
 
     
-    async def run_qotd(self, guild_id, channel_id):
-        # delete the last quote of the day
-        if Program.DO_DELETE_PREVIOUS_QOTD:
-            last_message_id_rows = Program.run_query_return_rows("SELECT last_message_id FROM qotd_subscription WHERE guild_id=(%s) AND channel_id=(%s)", (guild_id, channel_id))
-            for message_id_row in last_message_id_rows:
-                message_id = message_id_row[0]
-                if message_id != None:
+    async def dispatch_qotd(self, guild_id=None, channel_id=None):
+        Program.log(f"Sending quote of the day now!",0)
+        # one query for every subscription, one for every guild's quote, then all channels at once
+        if guild_id is None:
+            subscription_rows = await Program.run_query_return_rows("SELECT guild_id, channel_id, last_message_id FROM discord.qotd_subscription", ())
+        else:
+            subscription_rows = await Program.run_query_return_rows("SELECT guild_id, channel_id, last_message_id FROM discord.qotd_subscription WHERE guild_id=(%s) AND channel_id=(%s)", (guild_id, channel_id))
+        if len(subscription_rows) == 0:
+            return
+
+        messages = await self.get_random_quotes_for_guilds([row[0] for row in subscription_rows])
+        semaphore = asyncio.Semaphore(Program.QOTD_DISPATCH_CONCURRENCY)
+        results = await asyncio.gather(*[self.send_qotd(g, c, last_message_id, messages.get(g), semaphore) for g, c, last_message_id in subscription_rows], return_exceptions=True)
+
+        sent: list[tuple[int, int, int]] = []
+        for (g, c, _), result in zip(subscription_rows, results):
+            if isinstance(result, Exception):
+                Program.log(f"Quote of the day for {g}/{c} failed: {result}",2)
+            elif result != None:
+                sent.append((g, c, result))
+        await self.update_qotd_message_ids(sent)
+        Program.log(f"Quote of the day sent to {len(sent)}/{len(subscription_rows)} channels.",1)
+
+
+    async def send_qotd(self, guild_id, channel_id, last_message_id, message_content: str | None, semaphore: asyncio.Semaphore) -> int | None:
+        channel: discord.TextChannel = Program.bot.get_channel(channel_id)
+        if channel is None:
+            Program.log(f"Quote of the day channel {guild_id}/{channel_id} is not visible; skipping.",2)
+            return None
+        if message_content is None:
+            message_content = "There are no quotes saved for this server yet."
+
+        async with semaphore:
+            # delete the last quote of the day without fetching it first
+            if Program.DO_DELETE_PREVIOUS_QOTD:
+                if last_message_id != None:
                     try:
-                        channel: discord.TextChannel = Program.bot.get_channel(channel_id)
-                        last_message = await channel.fetch_message(message_id)
-                        await last_message.delete()
-                        Program.log(f"Last message {message_id} was deleted.",0)
+                        await channel.get_partial_message(last_message_id).delete()
+                        Program.log(f"Last message {last_message_id} was deleted.",0)
                     except discord.errors.NotFound:
-                        Program.log(f"Last message {message_id} was not found; ignoring.",0)
+                        Program.log(f"Last message {last_message_id} was not found; ignoring.",0)
+                    except discord.errors.Forbidden:
+                        Program.log(f"Not allowed to delete last message {last_message_id} in {guild_id}/{channel_id}; ignoring.",1)
                 else:
                     Program.log(f"No previous qotd message was found for {guild_id}/{channel_id}.",1)
 
-        channel = Program.bot.get_channel(channel_id)
-        message_content = await self.get_random_quote_from_guild(guild_id)
-        message = await channel.send(f"Quote of the day:\n{message_content}")
-        result = Program.call_procedure_return_scalar("update_qotd_message_id", (guild_id, channel_id, message.id))
+            message = await channel.send(f"Quote of the day:\n{message_content}")
+            return message.id
+
+
+    async def update_qotd_message_ids(self, sent: list[tuple[int, int, int]]):
+        # a single UPDATE joined against the new ids, rather than one procedure call per guild
+        if len(sent) == 0:
+            return
+        values = " UNION ALL ".join(["SELECT %s AS guild_id, %s AS channel_id, %s AS message_id"] * len(sent))
+        arguments = tuple(value for row in sent for value in row)
+        await Program.run_statement_return_rowcount(
+            f"UPDATE discord.qotd_subscription AS s JOIN ({values}) AS v ON s.guild_id=v.guild_id AND s.channel_id=v.channel_id SET s.last_message_id=v.message_id", arguments)
 
 
     @commands.command(name="quote", aliases=["q"], hidden=False, 
         brief='Create a quote from a user',
-        usage='<add `[quote in quotations] -[author](, time)(, location)`> OR <help>',
+        usage='<add `[quote in quotations] -[author](, time)(, location)`> OR <random> OR <search [words]> OR <help>',
         description='Create a quote to add it to the database')
     async def command_quote(self, context: commands.Context):
         if not Utility.is_valid_command_context(context, channel_type=self._default_channel_type, is_global_command=True, is_whisper_command=False):
@@ -77,7 +116,7 @@ class QuoteCog(commands.Cog):
                 input = input.replace("```","`") # If the user did the full code block format, change it back to inline code
                 markdown_positions = [i for i, char in enumerate(input) if char == "`"]
                 if len(markdown_positions) % 2 == 1:
-                    context.reply("Not a valid input (odd number of code markdown characters)")
+                    await context.reply("Not a valid input (odd number of code markdown characters)")
                     return
                 
                 raw_quotes: list[str] = []
@@ -89,32 +128,50 @@ class QuoteCog(commands.Cog):
                     quote_objects.append(Quote.parse_from_raw(quote))
 
                 # confirm the quote to add, and wait for reply
-                question_message = await context.reply(f"**Is this correct?** (y/n)", embeds=list(map(lambda x: x.get_embed(), quote_objects)))
+                # rendered once, for the confirmation now and the cache once it is saved
+                rendered = QuoteCog.render_quote_set(quote_objects)
+                question_message = await context.reply(f"**Is this correct?** (y/n)", embeds=list(map(discord.Embed.from_dict, rendered["embeds"])))
+
+                def reply_check(message: discord.Message):
+                    return message.author == context.author and message.channel == context.channel and message.content.lower().strip() in Program.AFFIRMATIVE_RESPONSE
                 try:
-                    def reply_check(message: discord.Message):
-                        return message.author == context.author and message.channel == context.channel and message.content.lower().strip() in Program.AFFIRMATIVE_RESPONSE
-    
                     await Program.bot.wait_for('message', check=reply_check, timeout=Program.CONFIRMATION_TIME)
-                    
-
-                    async with context.typing():
-                        hash = context.message.created_at.__hash__() ^ context.guild.__hash__()
-                        Program.log(f"Adding quote to database: with hash {hash} -> [{list(map(lambda x: str(x), quote_objects))}]",1)
-                        i = 0
-                        for quote_object in quote_objects:
-                            i = i + 1
-                            result = Program.call_procedure_return_scalar("insert_quote_with_set_id", (hash, i, context.guild.id, quote_object.quote, quote_object.author, quote_object.time_place))
-                            Program.log(f"Quote insert with result ({result})",0)
+                except asyncio.TimeoutError:
+                    await context.reply(f"No positive response recieved. No quote will be added.")
+                    return
 
+                async with context.typing():
+                    set_id = await self.insert_quote_set(context.guild.id, quote_objects, rendered)
+                if set_id is None:
+                    await context.reply(f"Your quote could not be saved. Nothing was added; please try again later.")
+                else:
                     await context.reply(f"Your quote has been added to the database.")
-                except:
-                    await context.reply(f"No positive response recieved. No quote will be added.")
 
             case "random" | "r" | "get" | "g":
                 message_content = ""
                 async with context.typing():
                     message_content = await self.get_random_quote_from_guild(context.guild.id)
                 await context.send(f"Quote of the day:\n{message_content}")
+
+            case "search" | "s" | "find" | "f":
+                query = command.get_command_from(2)
+                if Utility.is_null_or_whitespace(query):
+                    await context.reply(f"Give some words to search for. `{Program.command_character}quote search [words]`")
+                    return
+                async with context.typing():
+                    quote_index = await self.get_guild_quote_index(context.guild.id)
+                    set_ids = quote_index.search(query, Program.QUOTE_SEARCH_RESULT_LIMIT)
+                    rendered_sets = await self.get_rendered_sets([(context.guild.id, set_id) for set_id in set_ids])
+                if len(set_ids) == 0:
+                    await context.reply(f"No quotes matched `{query}`.")
+                    return
+                results = [Utility.truncate(rendered_sets[set_id]["markdown"], Program.QUOTE_SEARCH_RESULT_LENGTH) for set_id in set_ids if set_id in rendered_sets]
+                query = Utility.truncate(query, 100)
+                # drop the lowest ranked results until the reply fits in one message
+                while len(results) > 1 and sum(len(r) + 2 for r in results) + len(query) + 50 > Program.DISCORD_MESSAGE_LIMIT:
+                    results.pop()
+                reply = f"Top {len(results)} quote(s) matching `{query}`:\n" + "\n\n".join(results)
+                await context.reply(Utility.truncate(reply, Program.DISCORD_MESSAGE_LIMIT))
                     
             # unknown command or help
             case _:
@@ -144,7 +201,7 @@ class QuoteCog(commands.Cog):
         
         async with context.typing():
             Program.log(f"Subscribing {input_channel_id} to quote of the day for {context.guild.name}",1)
-            result = Program.call_procedure_return_scalar("subscribe_to_qotd", (context.guild.id, input_channel_id))
+            result = await Program.call_procedure_return_scalar("subscribe_to_qotd", (context.guild.id, input_channel_id))
 
         # final response to user
         await context.reply(f"{Program.bot.get_channel(input_channel_id).mention} will display the quote of the day.")
@@ -158,25 +215,227 @@ class QuoteCog(commands.Cog):
             await context.reply(f"You do not have the required permissions: `manage_messages`.")
             return
 
-        guild_channel_rows = Program.run_query_return_rows("SELECT guild_id, channel_id FROM discord.qotd_subscription WHERE guild_id=(%s) AND channel_id=(%s)", (context.guild.id, context.channel.id))
-        for guild_id, channel_id in guild_channel_rows:
-            await self.run_qotd(guild_id, channel_id)
+        await self.dispatch_qotd(context.guild.id, context.channel.id)
 
 
 # #############################
 # Helper Functions
 # #############################
 
+    async def insert_quote_set(self, guild_id, quotes: list[Quote], rendered: dict | None = None) -> int | None:
+        # the whole set is one multi-row INSERT in one transaction, so it is saved completely or not at all
+        set_id = Quote.make_set_id(guild_id, quotes)
+        Program.log(f"Adding quote to database: with set id {set_id} -> [{list(map(lambda x: str(x), quotes))}]",1)
+        rows = [(set_id, ordering, guild_id, q.quote, q.author, q.time_place) for ordering, q in enumerate(quotes, start=1)]
+        try:
+            inserted = await Program.run_statement_return_rowcount(
+                "INSERT INTO discord.quotes (set_id, ordering, guild_id, quote, author, time_place, date_created) VALUES (%s, %s, %s, %s, %s, %s, NOW())", rows, many=True)
+        except Exception as e:
+            # set ids come from the set's contents, so a duplicate key means this exact set is already saved
+            if getattr(e, "errno", None) == 1062:
+                Program.log(f"Quote set {set_id} is already saved.",1)
+                return set_id
+            Program.log(f"Quote set {set_id} could not be inserted: {repr(e)}",3)
+            return None
+        if inserted != len(rows):
+            return None
+        await self.add_set_to_guild(guild_id, set_id, quotes, rendered)
+        return set_id
+
+
+    async def add_set_to_guild(self, guild_id, set_id, quotes: list[Quote], rendered: dict | None = None):
+        # keep the lazily built structures current instead of dropping them
+        set_ids = self.guild_set_ids.get(guild_id, None)
+        is_new = set_ids is None or not set_id in set_ids
+        if set_ids is not None:
+            set_ids.add(set_id)
+        quote_index = self.guild_quote_indexes.get(guild_id, None)
+        if quote_index is not None:
+            quote_index.add_set(set_id, quotes)
+        # replaces anything cached under this id, so a set is never served from a stale render
+        self.get_rendered_cache(guild_id).set(set_id, rendered if rendered is not None else QuoteCog.render_quote_set(quotes))
+        rotation = self.guild_rotations.get(guild_id, None)
+        if rotation is not None and is_new:
+            await self.save_rotation_positions(guild_id, rotation.insert(set_id))
+
+
+    async def get_guild_quote_index(self, guild_id) -> QuoteIndex:
+        # built from every quote in the guild on the first search, then kept current by add_set_to_guild
+        quote_index = self.guild_quote_indexes.get(guild_id, None)
+        if quote_index is not None:
+            return quote_index
+        quote_index = QuoteIndex()
+        quote_rows = await Program.run_query_return_rows("SELECT set_id, quote, author, time_place FROM discord.quotes WHERE guild_id=(%s) ORDER BY set_id, ordering", (guild_id,))
+        quote_sets: dict[int, list[Quote]] = {}
+        for set_id, quote_string, quote_author, quote_time_place in quote_rows:
+            quote_sets.setdefault(set_id, []).append(Quote(quote_string, quote_author, quote_time_place))
+        for set_id, quotes in quote_sets.items():
+            quote_index.add_set(set_id, quotes)
+        # as with the set ids, an empty result may be an unreachable database
+        if len(quote_index) > 0:
+            self.guild_quote_indexes[guild_id] = quote_index
+        return quote_index
+
+
+    async def load_set_ids_for_guilds(self, guild_ids: list[int]):
+        # fill the set id cache for every guild that is not in it yet, in one query; add_set_to_guild keeps it current
+        missing = list(set(g for g in guild_ids if g not in self.guild_set_ids))
+        if len(missing) == 0:
+            return
+        placeholders = ", ".join(["%s"] * len(missing))
+        set_id_rows = await Program.run_query_return_rows(f"SELECT DISTINCT guild_id, set_id FROM discord.quotes WHERE guild_id IN ({placeholders})", tuple(missing))
+        for guild_id, set_id in set_id_rows:
+            self.guild_set_ids.setdefault(guild_id, set()).add(set_id)
+
+
+    async def get_quote_sets(self, set_ids: list[int]) -> dict[int, list[Quote]]:
+        if len(set_ids) == 0:
+            return {}
+        placeholders = ", ".join(["%s"] * len(set_ids))
+        quote_set_rows = await Program.run_query_return_rows(f"SELECT set_id, quote, author, time_place FROM discord.quotes WHERE set_id IN ({placeholders}) ORDER BY set_id, ordering", tuple(set_ids))
+        quote_sets: dict[int, list[Quote]] = {}
+        for set_id, quote_string, quote_author, quote_time_place in quote_set_rows:
+            quote_sets.setdefault(set_id, []).append(Quote(quote_string, quote_author, quote_time_place))
+        return quote_sets
+
+
+    def format_quote_set(quotes: list[Quote]) -> str:
+        return "\n".join(list(map(lambda x: f"> # {x.get_markdown_string()}", quotes)))
+
+
+    def render_quote_set(quotes: list[Quote]) -> dict:
+        # embeds are kept as dicts (discord.Embed.from_dict to send) so the cache holds plain data
+        return {
+            "markdown": QuoteCog.format_quote_set(quotes),
+            "embeds": [q.get_embed().to_dict() for q in quotes]
+        }
+
+
+    def get_rendered_cache(self, guild_id) -> TTLCache:
+        rendered_cache = self.guild_rendered_sets.get(guild_id, None)
+        if rendered_cache is None:
+            rendered_cache = TTLCache(Program.QUOTE_RENDER_CACHE_SIZE)
+            self.guild_rendered_sets[guild_id] = rendered_cache
+        return rendered_cache
+
+
+    async def get_rendered_sets(self, guild_set_ids: list[tuple[int, int]]) -> dict[int, dict]:
+        # only the sets missing from their guild's cache are read, all in one query
+        rendered_sets: dict[int, dict] = {}
+        missing: list[tuple[int, int]] = []
+        for guild_id, set_id in guild_set_ids:
+            rendered = self.get_rendered_cache(guild_id).get(set_id)
+            if rendered is None:
+                missing.append((guild_id, set_id))
+            else:
+                rendered_sets[set_id] = rendered
+        if len(missing) == 0:
+            return rendered_sets
+
+        quote_sets = await self.get_quote_sets(list(set(set_id for _, set_id in missing)))
+        for guild_id, set_id in missing:
+            if set_id in quote_sets:
+                rendered = QuoteCog.render_quote_set(quote_sets[set_id])
+                self.get_rendered_cache(guild_id).set(set_id, rendered)
+                rendered_sets[set_id] = rendered
+        return rendered_sets
+
+
+    async def get_random_quotes_for_guilds(self, guild_ids: list[int]) -> dict[int, str]:
+        chosen = await self.draw_from_rotations(guild_ids)
+        rendered_sets = await self.get_rendered_sets(list(chosen.items()))
+        return {guild_id: rendered_sets[set_id]["markdown"] for guild_id, set_id in chosen.items() if set_id in rendered_sets}
+
+
     async def get_random_quote_from_guild(self, guild_id) -> str:
-        import random
-        conversation_ids = Program.run_query_return_rows("SELECT DISTINCT set_id FROM discord.quotes WHERE guild_id=(%s)", (guild_id,))
-        choices = list(sum(conversation_ids, ()))
-        chosen = random.choice(choices)
+        messages = await self.get_random_quotes_for_guilds([guild_id])
+        return messages.get(guild_id, "There are no quotes saved for this server yet.")
+
+
+# #############################
+# Rotation
+# #############################
+
+    async def draw_from_rotations(self, guild_ids: list[int]) -> dict[int, int]:
+        # every set comes up once per cycle; a guild that has seen them all gets a fresh shuffle
+        await self.load_set_ids_for_guilds(guild_ids)
+        await self.load_rotations_for_guilds(guild_ids)
+        chosen: dict[int, int] = {}
+        for guild_id in set(guild_ids):
+            rotation = self.guild_rotations.get(guild_id, None)
+            if rotation is None:
+                continue
+            set_id = self.draw_existing_set(guild_id, rotation)
+            if set_id is None:
+                Program.log(f"Quote rotation for {guild_id} is exhausted; reshuffling {len(self.guild_set_ids[guild_id])} sets.",0)
+                rotation.shuffle(self.guild_set_ids[guild_id])
+                await self.save_rotation(guild_id)
+                set_id = rotation.draw()
+            if set_id is not None:
+                chosen[guild_id] = set_id
+        await self.save_rotation_cursors([(guild_id, self.guild_rotations[guild_id].cursor) for guild_id in chosen.keys()])
+        return chosen
+
+
+    def draw_existing_set(self, guild_id, rotation: QuoteRotation) -> int | None:
+        # sets deleted since the rotation was saved are passed over; the next reshuffle leaves them out for good
+        set_ids = self.guild_set_ids.get(guild_id, set())
+        set_id = rotation.draw()
+        while set_id is not None and not set_id in set_ids:
+            set_id = rotation.draw()
+        return set_id
+
+
+    async def load_rotations_for_guilds(self, guild_ids: list[int]):
+        # only guilds with known quotes get a rotation, so an unreachable database is retried next time
+        missing = list(set(g for g in guild_ids if g not in self.guild_rotations and len(self.guild_set_ids.get(g, [])) > 0))
+        if len(missing) == 0:
+            return
+        placeholders = ", ".join(["%s"] * len(missing))
+        rotation_rows = await Program.run_query_return_rows(f"SELECT guild_id, set_id FROM discord.quote_rotation WHERE guild_id IN ({placeholders}) ORDER BY guild_id, position", tuple(missing))
+        cursor_rows = await Program.run_query_return_rows(f"SELECT guild_id, next_position FROM discord.quote_rotation_cursor WHERE guild_id IN ({placeholders})", tuple(missing))
+        orders: dict[int, list[int]] = {}
+        for guild_id, set_id in rotation_rows:
+            orders.setdefault(guild_id, []).append(set_id)
+        cursors = {guild_id: next_position for guild_id, next_position in cursor_rows}
+
+        for guild_id in missing:
+            rotation = QuoteRotation(orders.get(guild_id, []), cursors.get(guild_id, 0))
+            self.guild_rotations[guild_id] = rotation
+            if len(rotation) == 0:
+                rotation.shuffle(self.guild_set_ids[guild_id])
+                await self.save_rotation(guild_id)
+                continue
+            # sets deleted behind the bot's back leave the rotation, so they are never drawn as an empty quote
+            if rotation.retain(self.guild_set_ids[guild_id]):
+                Program.log(f"Dropped deleted quote sets from the rotation for {guild_id}.",1)
+                await self.save_rotation(guild_id)
+            # sets added behind the bot's back (e.g. by the importer) join the part of the cycle still to come
+            in_rotation = set(rotation.order)
+            changed_positions = set()
+            for set_id in self.guild_set_ids[guild_id]:
+                if not set_id in in_rotation:
+                    changed_positions.update(rotation.insert(set_id))
+            await self.save_rotation_positions(guild_id, sorted(changed_positions))
+
+
+    async def save_rotation(self, guild_id):
+        # overwrite in place, then trim; a crash in between leaves a longer but still valid rotation
+        rotation = self.guild_rotations[guild_id]
+        await self.save_rotation_positions(guild_id, list(range(len(rotation))))
+        await Program.run_statement_return_rowcount("DELETE FROM discord.quote_rotation WHERE guild_id=(%s) AND position>=(%s)", (guild_id, len(rotation)))
+        await self.save_rotation_cursors([(guild_id, rotation.cursor)])
+
 
-        chosen_quotes: list[Quote] = []
+    async def save_rotation_positions(self, guild_id, positions: list[int]):
+        # the row alias rather than VALUES(): that form is deprecated, and the pool raises on its warning
+        rotation = self.guild_rotations[guild_id]
+        await Program.run_statement_return_rowcount(
+            "INSERT INTO discord.quote_rotation (guild_id, position, set_id) VALUES (%s, %s, %s) AS new ON DUPLICATE KEY UPDATE set_id=new.set_id",
+            [(guild_id, position, rotation.order[position]) for position in positions], many=True)
 
-        quote_set_rows = Program.run_query_return_rows("SELECT quote, author, time_place FROM discord.quotes WHERE set_id=(%s) ORDER BY ordering", (chosen,))
-        for quote_string, quote_author, quote_time_place in quote_set_rows:
-            chosen_quotes.append(Quote(quote_string, quote_author, quote_time_place))
 
-        return "\n".join(list(map(lambda x: f"> # {x.get_markdown_string()}", chosen_quotes)))
\ No newline at end of file
+    async def save_rotation_cursors(self, guild_cursors: list[tuple[int, int]]):
+        await Program.run_statement_return_rowcount(
+            "INSERT INTO discord.quote_rotation_cursor (guild_id, next_position) VALUES (%s, %s) AS new ON DUPLICATE KEY UPDATE next_position=new.next_position",
+            guild_cursors, many=True)
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import re
+import sys
+
+from dotenv import load_dotenv
+from state import Program
+
+MIGRATIONS_DIRECTORY_PATH = "migrations"
+
+
+def read_migrations() -> list[tuple[int, str, str]]:
+    # files are named like 002_add_indexes.sql; the number is the schema version they bring the database to
+    migrations = []
+    for file_name in sorted(os.listdir(MIGRATIONS_DIRECTORY_PATH)):
+        match = re.match(r"^(\d+)_(.+)\.sql$", file_name)
+        if match is None:
+            continue
+        with open(os.path.join(MIGRATIONS_DIRECTORY_PATH, file_name), encoding="utf-8") as file:
+            migrations.append((int(match.group(1)), file_name, file.read()))
+    return migrations
+
+
+def split_statements(script: str) -> list[str]:
+    # understands the mysql client's DELIMITER lines so migrations can define stored procedures
+    statements = []
+    delimiter = ";"
+    current = []
+    for line in script.splitlines():
+        stripped = line.strip()
+        if stripped.upper().startswith("DELIMITER "):
+            delimiter = stripped.split(None, 1)[1]
+            continue
+        if len(current) == 0 and (stripped == "" or stripped.startswith("--")):
+            continue
+        current.append(line)
+        if stripped.endswith(delimiter):
+            statement = "\n".join(current).rstrip()[:-len(delimiter)].strip()
+            if statement != "":
+                statements.append(statement)
+            current = []
+    trailing = "\n".join(current).strip()
+    if trailing != "":
+        statements.append(trailing)
+    return statements
+
+
+def get_applied_versions(connection) -> set[int]:
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE TABLE IF NOT EXISTS schema_migrations (version INT NOT NULL PRIMARY KEY, name VARCHAR(256) NOT NULL, applied_at DATETIME NOT NULL)")
+        cursor.execute("SELECT version FROM schema_migrations")
+        return set(row[0] for row in cursor.fetchall())
+
+
+def apply_migration(connection, version: int, name: str, script: str):
+    # mysql commits DDL implicitly, so a migration cannot be rolled back; each one is written to be safe to re-run instead
+    with connection.cursor() as cursor:
+        for statement in split_statements(script):
+            cursor.execute(statement)
+            if cursor.with_rows:
+                # migrations SELECT what they changed (e.g. how many rows they backed up) so it shows in the output
+                for row in cursor.fetchall():
+                    print(f"  {': '.join(str(value) for value in row)}")
+        cursor.execute("INSERT INTO schema_migrations (version, name, applied_at) VALUES (%s, %s, NOW())", (version, name))
+
+
+async def main():
+    load_dotenv()
+    # schema changes need more privileges than the bot's own account, so prefer an admin login when one is configured
+    db_config = {
+        "user": os.getenv("MYSQL_ADMIN_USER", os.getenv("MYSQL_USER")),
+        "password": os.getenv("MYSQL_ADMIN_PASS", os.getenv("MYSQL_PASS")),
+        "host": os.getenv("MYSQL_HOST"),
+        "database": os.getenv("MYSQL_DB"),
+        "autocommit": True
+    }
+    connection = await Program.connect_to_mysql(db_config)
+    if connection is None:
+        print("Could not connect to the database.")
+        return 1
+
+    try:
+        applied = get_applied_versions(connection)
+        pending = [m for m in read_migrations() if not m[0] in applied]
+        if "--status" in sys.argv:
+            for version, name, _ in read_migrations():
+                print(f"{'applied' if version in applied else 'pending'}\t{name}")
+            return 0
+
+        if len(pending) == 0:
+            print("Database schema is up to date.")
+        for version, name, script in pending:
+            print(f"Applying {name}...")
+            try:
+                apply_migration(connection, version, name, script)
+            except Exception as e:
+                print(f"Migration {name} failed: {e}")
+                return 1
+            print(f"Applied {name}.")
+        return 0
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,46 @@
+-- ----------------------------
+-- Brings databases created before setup_mysql.sql gained the rss_feeds validator columns
+-- and the rss_feed_seen_items table up to date. Safe to run against a fresh setup.
+-- ----------------------------
+
+DROP PROCEDURE IF EXISTS migration_001;
+
+DELIMITER $$
+CREATE PROCEDURE migration_001()
+BEGIN
+    IF NOT EXISTS (SELECT * FROM information_schema.COLUMNS WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME='rss_feeds' AND COLUMN_NAME='etag') THEN
+        ALTER TABLE rss_feeds ADD COLUMN etag VARCHAR(256) NULL;
+    END IF;
+    IF NOT EXISTS (SELECT * FROM information_schema.COLUMNS WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME='rss_feeds' AND COLUMN_NAME='last_modified') THEN
+        ALTER TABLE rss_feeds ADD COLUMN last_modified VARCHAR(64) NULL;
+    END IF;
+END $$
+DELIMITER ;
+
+CALL migration_001();
+DROP PROCEDURE migration_001;
+
+
+CREATE TABLE IF NOT EXISTS rss_feed_seen_items (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    rss_feed_id INTEGER NOT NULL REFERENCES rss_feeds(id),
+    item_key CHAR(16) NOT NULL,
+    seen_at DATETIME NOT NULL,
+    UNIQUE KEY (rss_feed_id, item_key)
+);
+
+
+DROP PROCEDURE IF EXISTS update_rss_feed_validators;
+
+DELIMITER $$
+CREATE PROCEDURE update_rss_feed_validators
+(
+	feed_name VARCHAR(64), 
+    input_etag VARCHAR(256),
+    input_last_modified VARCHAR(64)
+)
+BEGIN
+    UPDATE rss_feeds SET etag=input_etag, last_modified=input_last_modified WHERE unique_name=feed_name;
+    SELECT ROW_COUNT();
+END $$
+DELIMITER ;
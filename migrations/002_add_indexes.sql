@@ -0,0 +1,58 @@
+-- ----------------------------
+-- Secondary indexes for every lookup the bot makes. Duplicate rows that would
+-- violate the new unique keys are removed first, keeping the newest row. The
+-- removed rows are copied to <table>_duplicates_002 beforehand and counted in
+-- the migration output; INSERT IGNORE keeps a re-run from failing on rows
+-- that were already copied.
+-- ----------------------------
+
+DROP PROCEDURE IF EXISTS add_index_if_missing;
+
+DELIMITER $$
+CREATE PROCEDURE add_index_if_missing
+(
+    input_table VARCHAR(64),
+    input_index VARCHAR(64),
+    input_definition VARCHAR(256)
+)
+BEGIN
+    IF NOT EXISTS (SELECT * FROM information_schema.STATISTICS WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=input_table AND INDEX_NAME=input_index) THEN
+        SET @add_index_statement = CONCAT('ALTER TABLE ', input_table, ' ADD ', input_definition);
+        PREPARE add_index FROM @add_index_statement;
+        EXECUTE add_index;
+        DEALLOCATE PREPARE add_index;
+    END IF;
+END $$
+DELIMITER ;
+
+
+-- guild_channels: looked up and upserted by (guild_id, channel_type)
+CREATE TABLE IF NOT EXISTS guild_channels_duplicates_002 LIKE guild_channels;
+INSERT IGNORE INTO guild_channels_duplicates_002 SELECT DISTINCT older.* FROM guild_channels AS older
+    JOIN guild_channels AS newer ON older.guild_id=newer.guild_id AND older.channel_type=newer.channel_type AND older.id < newer.id;
+SELECT 'guild_channels duplicate rows backed up', COUNT(*) FROM guild_channels_duplicates_002;
+DELETE older FROM guild_channels AS older
+    JOIN guild_channels AS newer ON older.guild_id=newer.guild_id AND older.channel_type=newer.channel_type AND older.id < newer.id;
+CALL add_index_if_missing('guild_channels', 'ux_guild_channels_guild_type', 'UNIQUE INDEX ux_guild_channels_guild_type (guild_id, channel_type)');
+
+-- rss_feed_subscribers: joined on rss_feed_id and checked by (rss_feed_id, channel_id)
+CREATE TABLE IF NOT EXISTS rss_feed_subscribers_duplicates_002 LIKE rss_feed_subscribers;
+INSERT IGNORE INTO rss_feed_subscribers_duplicates_002 SELECT DISTINCT older.* FROM rss_feed_subscribers AS older
+    JOIN rss_feed_subscribers AS newer ON older.rss_feed_id=newer.rss_feed_id AND older.channel_id=newer.channel_id AND older.id < newer.id;
+SELECT 'rss_feed_subscribers duplicate rows backed up', COUNT(*) FROM rss_feed_subscribers_duplicates_002;
+DELETE older FROM rss_feed_subscribers AS older
+    JOIN rss_feed_subscribers AS newer ON older.rss_feed_id=newer.rss_feed_id AND older.channel_id=newer.channel_id AND older.id < newer.id;
+CALL add_index_if_missing('rss_feed_subscribers', 'ux_rss_feed_subscribers_feed_channel', 'UNIQUE INDEX ux_rss_feed_subscribers_feed_channel (rss_feed_id, channel_id)');
+
+-- quotes: sets are listed per guild and fetched by set_id in ordering order
+CREATE TABLE IF NOT EXISTS quotes_duplicates_002 LIKE quotes;
+INSERT IGNORE INTO quotes_duplicates_002 SELECT DISTINCT older.* FROM quotes AS older
+    JOIN quotes AS newer ON older.set_id=newer.set_id AND older.ordering=newer.ordering AND older.id < newer.id;
+SELECT 'quotes duplicate rows backed up', COUNT(*) FROM quotes_duplicates_002;
+DELETE older FROM quotes AS older
+    JOIN quotes AS newer ON older.set_id=newer.set_id AND older.ordering=newer.ordering AND older.id < newer.id;
+CALL add_index_if_missing('quotes', 'ix_quotes_guild_set', 'INDEX ix_quotes_guild_set (guild_id, set_id)');
+CALL add_index_if_missing('quotes', 'ux_quotes_set_ordering', 'UNIQUE INDEX ux_quotes_set_ordering (set_id, ordering)');
+
+-- qotd_subscription: looked up by (guild_id, channel_id); guild_id is already unique
+CALL add_index_if_missing('qotd_subscription', 'ix_qotd_subscription_guild_channel', 'INDEX ix_qotd_subscription_guild_channel (guild_id, channel_id)');
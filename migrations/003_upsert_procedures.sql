@@ -0,0 +1,136 @@
+-- ----------------------------
+-- Replaces the IF EXISTS ... UPDATE ELSE INSERT procedures with single
+-- index-backed statements now that the natural keys are unique. The upserts use
+-- the row alias (VALUES ... AS new) because VALUES(col) is deprecated and its
+-- warning is raised as an error by the bot's connections.
+-- ----------------------------
+
+DROP PROCEDURE IF EXISTS insert_or_update_guild_channel;
+
+DELIMITER $$
+CREATE PROCEDURE insert_or_update_guild_channel
+(
+	input_guild_id BIGINT, 
+    input_channel_type VARCHAR(64), 
+    input_channel_id BIGINT
+)
+BEGIN
+    INSERT INTO guild_channels (guild_id, channel_type, channel_id) VALUES (input_guild_id, input_channel_type, input_channel_id) AS new
+        ON DUPLICATE KEY UPDATE channel_id=new.channel_id;
+    SELECT ROW_COUNT();
+END $$
+DELIMITER ;
+
+
+DROP PROCEDURE IF EXISTS insert_or_update_radio_station;
+
+DELIMITER $$
+CREATE PROCEDURE insert_or_update_radio_station
+(
+	input_unique_name VARCHAR(64), 
+    input_display_name VARCHAR(128), 
+    input_url VARCHAR(256),
+    input_is_opus BOOLEAN
+)
+BEGIN
+    INSERT INTO radio_stations (unique_name, display_name, url, is_opus) VALUES (input_unique_name, input_display_name, input_url, input_is_opus) AS new
+        ON DUPLICATE KEY UPDATE display_name=new.display_name, url=new.url, is_opus=new.is_opus;
+    SELECT ROW_COUNT();
+END $$
+DELIMITER ;
+
+
+DROP PROCEDURE IF EXISTS insert_or_update_rss_feed;
+
+DELIMITER $$
+CREATE PROCEDURE insert_or_update_rss_feed
+(
+	input_unique_name VARCHAR(64), 
+    input_url VARCHAR(256)
+)
+BEGIN
+    INSERT INTO rss_feeds (unique_name, url) VALUES (input_unique_name, input_url) AS new
+        ON DUPLICATE KEY UPDATE url=new.url;
+    SELECT ROW_COUNT();
+END $$
+DELIMITER ;
+
+
+DROP PROCEDURE IF EXISTS subscribe_to_rss_feed;
+
+DELIMITER $$
+CREATE PROCEDURE subscribe_to_rss_feed
+(
+	feed_name VARCHAR(64), 
+    input_channel_id BIGINT
+)
+BEGIN
+    INSERT IGNORE INTO rss_feed_subscribers (rss_feed_id, channel_id)
+        SELECT id, input_channel_id FROM rss_feeds WHERE unique_name=feed_name;
+    SELECT ROW_COUNT();
+END $$
+DELIMITER ;
+
+
+DROP PROCEDURE IF EXISTS unsubscribe_to_rss_feed;
+
+DELIMITER $$
+CREATE PROCEDURE unsubscribe_to_rss_feed
+(
+	feed_name VARCHAR(64), 
+    input_channel_id BIGINT
+)
+BEGIN
+    DELETE s FROM rss_feed_subscribers AS s JOIN rss_feeds AS f ON s.rss_feed_id=f.id
+        WHERE f.unique_name=feed_name AND s.channel_id=input_channel_id;
+    SELECT ROW_COUNT();
+END $$
+DELIMITER ;
+
+
+DROP PROCEDURE IF EXISTS insert_or_update_settings;
+
+DELIMITER $$
+CREATE PROCEDURE insert_or_update_settings
+(
+	input_name VARCHAR(64), 
+    input_value VARCHAR(128)
+)
+BEGIN
+    INSERT INTO settings (name, value) VALUES (input_name, input_value) AS new
+        ON DUPLICATE KEY UPDATE value=new.value;
+    SELECT ROW_COUNT();
+END $$
+DELIMITER ;
+
+
+DROP PROCEDURE IF EXISTS subscribe_to_qotd;
+
+DELIMITER $$
+CREATE PROCEDURE subscribe_to_qotd
+(
+	input_guild_id BIGINT, 
+    input_channel_id BIGINT
+)
+BEGIN
+    INSERT INTO qotd_subscription (guild_id, channel_id) VALUES (input_guild_id, input_channel_id) AS new
+        ON DUPLICATE KEY UPDATE channel_id=new.channel_id;
+    SELECT ROW_COUNT();
+END $$
+DELIMITER ;
+
+
+DROP PROCEDURE IF EXISTS update_qotd_message_id;
+
+DELIMITER $$
+CREATE PROCEDURE update_qotd_message_id
+(
+	input_guild_id BIGINT, 
+    input_channel_id BIGINT,
+    input_message_id BIGINT
+)
+BEGIN
+    UPDATE qotd_subscription SET last_message_id=input_message_id WHERE guild_id=input_guild_id AND channel_id=input_channel_id;
+    SELECT ROW_COUNT();
+END $$
+DELIMITER ;
@@ -0,0 +1,17 @@
+-- ----------------------------
+-- Per-guild shuffled order of quote sets for the quote of the day and random
+-- draws, and how far each guild has got through it.
+-- ----------------------------
+
+CREATE TABLE IF NOT EXISTS quote_rotation (
+    guild_id BIGINT NOT NULL,
+    position INT NOT NULL,
+    set_id BIGINT NOT NULL,
+    PRIMARY KEY (guild_id, position)
+);
+
+
+CREATE TABLE IF NOT EXISTS quote_rotation_cursor (
+    guild_id BIGINT NOT NULL PRIMARY KEY,
+    next_position INT NOT NULL
+);
@@ -1,40 +1,129 @@
 
-import datetime
+import asyncio
 import json
 import os
+import sys
+import time
 
 from dotenv import load_dotenv
 from classes.quote import Quote
+from quote_txt_to_json import iter_quote_sets
 from state import Program, Utility
 
+DEFAULT_GUILD_ID = 350330699192074250
+DEFAULT_INPUT_FILE = "quotes.json"
+DEFAULT_BATCH_SIZE = 500
+INSERT_QUOTE_STATEMENT = "INSERT IGNORE INTO discord.quotes (set_id, ordering, guild_id, quote, author, time_place, date_created) VALUES (%s, %s, %s, %s, %s, %s, NOW())"
 
-def main():
+
+def iter_json_array(file, chunk_size=1 << 16):
+    # yields the elements of a top-level json array without holding the whole document in memory
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    eof = False
+    while not eof:
+        chunk = file.read(chunk_size)
+        eof = chunk == ""
+        buffer += chunk
+        if not started:
+            buffer = buffer.lstrip()
+            if len(buffer) == 0:
+                continue
+            if buffer[0] != "[":
+                raise ValueError("Expected a json array of quote sets")
+            buffer = buffer[1:]
+            started = True
+        while True:
+            buffer = buffer.lstrip()
+            if buffer.startswith(","):
+                buffer = buffer[1:].lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                element, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # the element continues in the next chunk
+                break
+            yield element
+            buffer = buffer[end:]
+    if not Utility.is_null_or_whitespace(buffer):
+        raise ValueError("Unexpected end of json array")
+
+
+def read_quote_sets(path: str):
+    with open(path, "r", encoding="utf-8") as file:
+        if path.endswith(".txt"):
+            yield from iter_quote_sets(file)
+            return
+        if path.endswith(".jsonl"):
+            raw_sets = (json.loads(line) for line in file if not Utility.is_null_or_whitespace(line))
+        else:
+            raw_sets = iter_json_array(file)
+        for raw_set in raw_sets:
+            yield [Quote(q.get("quote", None), q.get("author", None), q.get("time_place", None)) for q in raw_set]
+
+
+async def import_quote_sets(quote_sets, guild_id: int, batch_size=DEFAULT_BATCH_SIZE) -> tuple[int, int]:
+    # rows are flushed as one multi-row INSERT IGNORE per transaction; deterministic set ids make re-runs skip what is already there
+    set_count = 0
+    inserted_count = 0
+    batch: list[tuple] = []
+    started = time.perf_counter()
+
+    async def flush():
+        nonlocal inserted_count, batch
+        inserted_count += await Program.run_statement_return_rowcount(INSERT_QUOTE_STATEMENT, batch, many=True)
+        batch = []
+        elapsed = max(time.perf_counter() - started, 0.001)
+        print(f"{set_count} sets read, {inserted_count} quotes inserted ({round(inserted_count / elapsed)} quotes/s)")
+
+    for quotes in quote_sets:
+        if len(quotes) == 0:
+            continue
+        set_count += 1
+        set_id = Quote.make_set_id(guild_id, quotes)
+        for ordering, quote in enumerate(quotes, start=1):
+            batch.append((set_id, ordering, guild_id, quote.quote, quote.author, quote.time_place))
+        if len(batch) >= batch_size:
+            await flush()
+    if len(batch) > 0:
+        await flush()
+    return (set_count, inserted_count)
+
+
+def load_db_config():
     load_dotenv()
-    db_config = {
+    Program.db_config = {
         "user": os.getenv("MYSQL_USER"),
         "password": os.getenv("MYSQL_PASS"),
         "host": os.getenv("MYSQL_HOST"),
         "database": os.getenv("MYSQL_DB"),
-        "raise_on_warnings": True
+        "raise_on_warnings": False # INSERT IGNORE reports skipped duplicates as warnings
     }
-    Program.db_config = db_config
-
-    guild_id = 350330699192074250
-    with open('quotes.json', 'r') as f:
-        data = json.load(f)
-        i = 0
-        l = len(data)
-        for set in data:
-            hash = datetime.datetime.now().timestamp().__hash__() + i
-            i = i + 1
-            j = 1
-            for q in set:
-                quote = q.get("quote", None)
-                author = q.get("author", None)
-                time_place = q.get("time_place", None)
-                result = Program.call_procedure_return_scalar("insert_quote_with_set_id", (hash, j, guild_id, quote, author, time_place))
-                print(f"{i}/{l}. result:{result} unique:{hash}")
-                j = j + 1
+
+
+async def run_import(quote_sets, guild_id: int, batch_size=DEFAULT_BATCH_SIZE):
+    load_db_config()
+    started = time.perf_counter()
+    try:
+        (set_count, inserted_count) = await import_quote_sets(quote_sets, guild_id, batch_size)
+    finally:
+        await Program.get_db_pool().close()
+    print(f"Done: {set_count} sets, {inserted_count} new quotes in {round(time.perf_counter() - started, 1)}s")
+
+
+async def main():
+    # usage: quote_json_to_db.py [guild_id] [quotes.json|quotes.jsonl|quotes.txt] (--batch=N)
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    guild_id = int(args[0]) if len(args) > 0 else DEFAULT_GUILD_ID
+    path = args[1] if len(args) > 1 else DEFAULT_INPUT_FILE
+    batch_size = DEFAULT_BATCH_SIZE
+    for a in sys.argv[1:]:
+        if a.startswith("--batch="):
+            batch_size = int(a[len("--batch="):])
+
+    await run_import(read_quote_sets(path), guild_id, batch_size)
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
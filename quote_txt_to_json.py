@@ -1,24 +1,88 @@
-
+import itertools
 import json
+import sys
 from classes.quote import Quote
 from state import Utility
 
+DEFAULT_INPUT_FILE = "quotes.txt"
+DEFAULT_OUTPUT_FILE = "quotes.jsonl"
+WORKER_CHUNK_SIZE = 256
+
+
+def iter_raw_sets(lines):
+    # sets are separated by one or more blank lines
+    this_set: list[str] = []
+    for line in lines:
+        if Utility.is_null_or_whitespace(line):
+            if len(this_set) > 0:
+                yield this_set
+            this_set = []
+        else:
+            this_set.append(line)
+    if len(this_set) > 0:
+        yield this_set
+
+
+def parse_raw_set(raw_set: list[str]) -> list[Quote]:
+    quotes = (Quote.parse_from_raw(line) for line in raw_set)
+    return [q for q in quotes if q != None]
+
+
+def iter_quote_sets(lines, processes=1):
+    raw_sets = iter_raw_sets(lines)
+    if processes <= 1:
+        for raw_set in raw_sets:
+            quotes = parse_raw_set(raw_set)
+            if len(quotes) > 0:
+                yield quotes
+        return
+
+    # hand the workers a bounded window at a time; Pool.imap would read the whole file ahead of the consumer
+    import multiprocessing
+    window_size = processes * WORKER_CHUNK_SIZE * 2
+    with multiprocessing.Pool(processes) as pool:
+        while True:
+            window = list(itertools.islice(raw_sets, window_size))
+            if len(window) == 0:
+                break
+            for quotes in pool.map(parse_raw_set, window, chunksize=WORKER_CHUNK_SIZE):
+                if len(quotes) > 0:
+                    yield quotes
+
+
+def write_json_lines(quote_sets, write_file) -> int:
+    count = 0
+    for quotes in quote_sets:
+        write_file.write(json.dumps([q.as_dict() for q in quotes], ensure_ascii=False))
+        write_file.write("\n")
+        count += 1
+    return count
+
 
 def main():
-    quote_sets: list[list[dict]] = []
-    with open("quotes.txt", "r", encoding='utf-8') as read_file:
-        this_set: list[dict] = [] 
-        for line in read_file:
-            if Utility.is_null_or_whitespace(line):
-                quote_sets.append(this_set.copy())
-                this_set.clear()
-            else:
-                quote = Quote.parse_from_raw(line.encode("utf-16").decode("utf-16"))
-                if quote != None:
-                    this_set.append(quote.as_dict())
-
-    with open("quotes.json", "w+") as write_file:
-        json.dump(quote_sets, write_file, indent=4)
+    # usage: quote_txt_to_json.py [quotes.txt] [quotes.jsonl] (--processes=N) (--import=GUILD_ID)
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    input_path = args[0] if len(args) > 0 else DEFAULT_INPUT_FILE
+    output_path = args[1] if len(args) > 1 else DEFAULT_OUTPUT_FILE
+    processes = 1
+    import_guild_id = None
+    for a in sys.argv[1:]:
+        if a.startswith("--processes="):
+            processes = int(a[len("--processes="):])
+        elif a.startswith("--import="):
+            import_guild_id = int(a[len("--import="):])
+
+    with open(input_path, "r", encoding="utf-8") as read_file:
+        quote_sets = iter_quote_sets(read_file, processes)
+        if import_guild_id != None:
+            # straight into the database, no intermediate file
+            import asyncio
+            from quote_json_to_db import run_import
+            asyncio.run(run_import(quote_sets, import_guild_id))
+            return
+        with open(output_path, "w", encoding="utf-8") as write_file:
+            count = write_json_lines(quote_sets, write_file)
+    print(f"Wrote {count} quote sets to {output_path}")
 
 if __name__ == "__main__":
     main()
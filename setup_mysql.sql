@@ -1,3 +1,9 @@
+-- ----------------------------
+-- Base schema only. Run `py migrate.py` after this on a fresh install as well:
+-- the unique keys, upsert procedures and quote rotation tables the bot relies on
+-- are created by the files in migrations/, not here.
+-- ----------------------------
+
 CREATE DATABASE 'discord';
 CREATE USER 'discord'@'%' IDENTIFIED BY 'discord';
 GRANT SELECT, INSERT, UPDATE, DELETE, EXECUTE ON discord.* TO 'discord';
@@ -21,7 +27,18 @@ CREATE TABLE guild_channels (
 CREATE TABLE rss_feeds (
     id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
     unique_name VARCHAR(64) UNIQUE NOT NULL,
-    url VARCHAR(256) NOT NULL
+    url VARCHAR(256) NOT NULL,
+    etag VARCHAR(256) NULL,
+    last_modified VARCHAR(64) NULL
+);
+
+
+CREATE TABLE rss_feed_seen_items (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    rss_feed_id INTEGER NOT NULL REFERENCES rss_feeds(id),
+    item_key CHAR(16) NOT NULL,
+    seen_at DATETIME NOT NULL,
+    UNIQUE KEY (rss_feed_id, item_key)
 );
 
 
@@ -94,6 +111,20 @@ END $$
 DELIMITER ;
 
 
+DELIMITER $$
+CREATE PROCEDURE update_rss_feed_validators
+(
+	feed_name VARCHAR(64), 
+    input_etag VARCHAR(256),
+    input_last_modified VARCHAR(64)
+)
+BEGIN
+    UPDATE rss_feeds SET etag=input_etag, last_modified=input_last_modified WHERE unique_name=feed_name;
+    SELECT ROW_COUNT();
+END $$
+DELIMITER ;
+
+
 DELIMITER $$
 CREATE PROCEDURE subscribe_to_rss_feed
 (
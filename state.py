@@ -24,6 +24,12 @@ class ResponseType(Enum):
     UNKNOWN = 3
 
 
+class ProgramBot(commands.Bot):
+    async def close(self):
+        await super().close()
+        await Program.shutdown()
+
+
 class Program:
     CONFIRMATION_TIME = 10.0 # seconds
     CHANNEL_TYPES = ["command", "jukebox", "rss", "localhost" ]
@@ -31,7 +37,21 @@ class Program:
     NEGATIVE_RESPONSE = ["n", "no", "nah", "nay", "f", "false", "nope"]
     END_RESPONSE = ["s", "stop", "e", "end", "exit", "h", "halt", "q", "quit"]
     YTDL_OPTIONS = {"format": "bestaudio/best", "noplaylist":"True", "quiet":"True"}
+    YTDL_HOSTS = ["youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com", "youtu.be", "soundcloud.com"]
     FFMPEG_OPTIONS = {'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5', 'options': '-vn -filter:a "volume=0.33"'}
+    BROADCAST_LISTENER_BUFFER = 25 # opus frames (20ms each) buffered per listening guild
+    MEDIA_QUEUE_LIMIT = 20
+    MEDIA_LIBRARY_FILE_NAME = "media_library.json"
+    MEDIA_LIBRARY_EXTENSIONS = [".mp3", ".ogg", ".opus", ".flac", ".m4a", ".wav", ".webm"]
+    MEDIA_LIBRARY_PROBE_CONCURRENCY = 4
+    MEDIA_LIBRARY_SCAN_INTERVAL = 60*60 # seconds
+    MEDIA_LIBRARY_FUZZY_CUTOFF = 0.6
+    MEDIA_LIBRARY_RESULT_LIMIT = 5
+    MEDIA_CACHE_FILE_NAME = "media_cache.json"
+    MEDIA_CACHE_PERSIST = True
+    MEDIA_CACHE_MAX_ENTRIES = 256
+    MEDIA_PROBE_CACHE_TTL = 60*60*24 # seconds
+    MEDIA_URL_CACHE_TTL = 60*60*4 # seconds; resolved video site urls are signed and expire
     WHITELISTED_PROTOCOLS = ["http", "https", "file", "tcp", "udp", "rtp"]
     FILE_PROTOCOL_PREFIX = "file"
     SETTINGS_DIRECTORY_PATH = "settings"
@@ -40,8 +60,49 @@ class Program:
     RADIO_STATIONS_FILE_NAME = "radio_stations.json"
     MAX_NEW_RSS_STORIES_PER_CYCLE = 3
     RSS_FEED_UPDATE_TIMER = 60*60*2
+    RSS_FEED_FETCH_CONCURRENCY = 8
+    RSS_FEED_FETCH_TIMEOUT = 30 # seconds
+    RSS_FEED_MIN_POLL_INTERVAL = 60*10 # seconds
+    RSS_FEED_MAX_POLL_INTERVAL = 60*60*12 # seconds
+    RSS_FEED_RATE_SAMPLE_SIZE = 10
+    RSS_FEED_POLL_JITTER = 0.1
+    RSS_FEED_STARTUP_SPREAD = 60*5 # seconds
+    RSS_FEED_SEEN_ITEMS_LIMIT = 500
+    RSS_DELIVERY_CONCURRENCY = 10
+    RSS_DELIVERY_ATTEMPTS = 3
     QOTD_HOUR_OF_DAY = 4
     DO_DELETE_PREVIOUS_QOTD = True
+    QOTD_DISPATCH_CONCURRENCY = 10
+    QUOTE_SEARCH_RESULT_LIMIT = 5
+    QUOTE_SEARCH_RESULT_LENGTH = 500 # characters of each result shown, so one long set cannot crowd out the rest
+    DISCORD_MESSAGE_LIMIT = 2000 # characters
+    QUOTE_RENDER_CACHE_SIZE = 256 # rendered sets kept per guild
+    SCHEDULER_TIMEZONE = None # IANA zone name for daily jobs, None for the host's local zone
+    JOB_SCHEDULER_MAX_SLEEP = 60*60 # seconds
+    JOB_SETTINGS_FILE_NAME = "jobs.json"
+    DB_POOL_SIZE = 5
+    DB_POOL_IDLE_TIMEOUT = 60*5 # seconds
+    DB_POOL_HEALTH_CHECK_AFTER = 30 # seconds
+    DB_BREAKER_FAILURE_THRESHOLD = 5
+    DB_BREAKER_RESET_TIMEOUT = 30 # seconds
+    HTTP_TIMEOUT = 20 # seconds
+    HTTP_CONNECTION_LIMIT = 100
+    HTTP_CONNECTION_LIMIT_PER_HOST = 8
+    HTTP_HOST_CONNECTION_LIMITS = {"api.openweathermap.org": 4, "geokeo.com": 2}
+    HTTP_KEEPALIVE_TIMEOUT = 60 # seconds
+    HTTP_DNS_CACHE_TTL = 60*5 # seconds
+    HTTP_CACHE_MAX_ENTRIES = 1024
+    # seconds a successful response is reused per host; hosts not listed here (random jokes, facts, etc.) are never cached
+    HTTP_CACHE_TTLS = {
+        "api.dictionaryapi.dev": 60*60*24,
+        "api.aviationapi.com": 60*60*24,
+        "color.serialif.com": 60*60*24*7,
+        "newton.now.sh": 60*60*24,
+        "geokeo.com": 60*60*24,
+        "api.techniknews.net": 60*60,
+        "api.openweathermap.org": 60*10,
+        "api.mcsrvstat.us": 60
+    }
 
     bot: commands.Bot
     guild_instances: dict[int, object]
@@ -50,11 +111,18 @@ class Program:
     owner_admin_id: int
     use_database: bool
     db_config = dict
+    db_pool = None
+    db_breaker = None
+    db_stats = {"failed_connects": 0, "retries": 0}
+    http_session = None
+    http_host_limiters = {}
+    http_cache = None
+    job_scheduler = None
 
 
     def initialize(command_char: str, control_channel_id: int, owner_admin_id: int, use_database: bool, db_config: dict) -> None:
         Program.command_character = command_char
-        Program.bot = commands.Bot(command_prefix=command_char, intents=discord.Intents.all())
+        Program.bot = ProgramBot(command_prefix=command_char, intents=discord.Intents.all())
         Program.guild_instances = {}
         Program.control_channel_id = control_channel_id
         Program.owner_admin_id = owner_admin_id
@@ -64,6 +132,16 @@ class Program:
         Program.log("Program.initialize ended",0)
 
 
+    async def shutdown():
+        if Program.job_scheduler is not None:
+            await Program.job_scheduler.stop()
+        if Program.http_session is not None and not Program.http_session.closed:
+            await Program.http_session.close()
+        if Program.db_pool is not None:
+            await Program.db_pool.close()
+        Program.log("Program.shutdown ended",0)
+
+
     def get_help_instructions(command_name) -> str:
         return f"Incorrect command usage. Use `{Program.command_character}help {command_name}` for correct usage."
     
@@ -108,55 +186,175 @@ class Program:
         print(f"[{now}] {crit_char}\t{text}")
 
 
-    def connect_to_mysql(config, attempts=3, delay=2):
+    async def connect_to_mysql(config, attempts=3, delay=2):
+        import asyncio
+        import random
         import mysql.connector
-        import time
+        breaker = Program.get_db_breaker()
         attempt = 1
         while attempt < attempts + 1:
+            (allowed, is_probe) = breaker.allow_request()
+            if not allowed:
+                # the database has failed repeatedly; fail fast until the breaker lets a probe through
+                Program.log(f"Database circuit is {breaker.state}, not attempting to connect",2)
+                return None
             try:
-                return mysql.connector.connect(**config)
+                connection = await asyncio.to_thread(mysql.connector.connect, **config)
+                breaker.record_success()
+                return connection
             except (mysql.connector.Error, IOError) as err:
+                breaker.record_failure()
+                # the failure settled the probe; by the time the retry delay ends another caller may hold a new one
+                is_probe = False
+                Program.db_stats["failed_connects"] += 1
                 if (attempts is attempt):
                     # Attempts to reconnect failed; returning None
                     Program.log(f"Failed to connect, exiting without a connection: {err}",3)
                     return None
                 Program.log(f"Connection failed: {err}. Retrying ({attempt}/{attempts-1})...",2)
-                # progressive reconnect delay
-                time.sleep(delay ** attempt)
+                Program.db_stats["retries"] += 1
+                # progressive reconnect delay with full jitter so reconnecting callers do not retry in lockstep
+                await asyncio.sleep(random.uniform(0, delay ** attempt))
                 attempt += 1
+            finally:
+                # any other exception (cancellation included) must not leave the half-open probe claimed forever;
+                # callers admitted while the breaker was closed never held it, so they leave it alone
+                if is_probe:
+                    breaker.release_probe()
         return None
+
+
+    def get_db_breaker():
+        from classes.circuit_breaker import CircuitBreaker
+        if Program.db_breaker is None:
+            Program.db_breaker = CircuitBreaker("mysql", Program.DB_BREAKER_FAILURE_THRESHOLD, Program.DB_BREAKER_RESET_TIMEOUT)
+        return Program.db_breaker
+
+
+    def get_database_stats() -> dict:
+        stats = {**Program.get_db_breaker().as_dict(), **Program.db_stats}
+        stats["idle_connections"] = Program.db_pool.size() if Program.db_pool is not None else 0
+        return stats
     
 
-    def run_query_return_rows(select_statement: str, arguments: tuple = ()):
-        connection = Program.connect_to_mysql(Program.db_config)
-        if connection and connection.is_connected():
-            data = []
-            try:
-                with connection.cursor(buffered=True) as cursor:
-                    Program.log(f"QUERY:({select_statement}) PARAM:{arguments}",0)
-                    cursor.execute(select_statement, arguments)
-            finally:
-                connection.close()
-            return cursor.fetchall()
-        else:
+    def get_job_scheduler():
+        from classes.job_scheduler import JobScheduler
+        if Program.job_scheduler is None:
+            Program.job_scheduler = JobScheduler()
+        return Program.job_scheduler
+
+
+    def get_db_pool():
+        from classes.connection_pool import ConnectionPool
+        if Program.db_pool is None:
+            Program.db_pool = ConnectionPool(Program.open_pooled_connection, Program.DB_POOL_SIZE, Program.DB_POOL_IDLE_TIMEOUT, Program.DB_POOL_HEALTH_CHECK_AFTER)
+        return Program.db_pool
+
+
+    async def open_pooled_connection():
+        # pooled connections are shared between statements, so autocommit keeps each SELECT from reading a stale snapshot
+        return await Program.connect_to_mysql({**Program.db_config, "autocommit": True})
+
+
+    def get_http_session() -> aiohttp.ClientSession:
+        # one session for the whole process so repeated lookups reuse warm keep-alive connections and cached DNS
+        if Program.http_session is None or Program.http_session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=Program.HTTP_CONNECTION_LIMIT,
+                limit_per_host=Program.HTTP_CONNECTION_LIMIT_PER_HOST,
+                keepalive_timeout=Program.HTTP_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=Program.HTTP_DNS_CACHE_TTL)
+            Program.http_session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=Program.HTTP_TIMEOUT))
+        return Program.http_session
+
+
+    def get_http_cache():
+        from classes.ttl_cache import TTLCache
+        if Program.http_cache is None:
+            Program.http_cache = TTLCache(Program.HTTP_CACHE_MAX_ENTRIES)
+        return Program.http_cache
+
+
+    def get_http_host_limiter(url: str):
+        import asyncio
+        import contextlib
+        from urllib.parse import urlsplit
+        host = urlsplit(url).hostname
+        limit = Program.HTTP_HOST_CONNECTION_LIMITS.get(host, None)
+        if limit is None:
+            return contextlib.nullcontext()
+        if host not in Program.http_host_limiters:
+            Program.http_host_limiters[host] = asyncio.Semaphore(limit)
+        return Program.http_host_limiters[host]
+
+
+    async def run_query_return_rows(select_statement: str, arguments: tuple = ()):
+        import asyncio
+        from classes.connection_pool import DatabaseUnavailableError
+
+        def execute(connection):
+            with connection.cursor(buffered=True) as cursor:
+                cursor.execute(select_statement, arguments)
+                return cursor.fetchall()
+
+        try:
+            async with Program.get_db_pool().connection() as connection:
+                Program.log(f"QUERY:({select_statement}) PARAM:{arguments}",0)
+                return await asyncio.to_thread(execute, connection)
+        except DatabaseUnavailableError:
             Program.log(f"Failed to call ({select_statement})",3)
             return []
         
 
-    def call_procedure_return_scalar(procedure: str, arguments: tuple):
-        connection = Program.connect_to_mysql(Program.db_config)
-        connection.autocommit = True
-        if connection and connection.is_connected():
-            try:
-                with connection.cursor() as cursor:
-                    Program.log(f"SP:({procedure}) PARAM:{arguments}",0)
-                    cursor.callproc(procedure, arguments)
-                    
-            finally:
-                connection.close()
-            Program.log(f"  SP returned rowcount={cursor.rowcount}",0)
-            return cursor.rowcount
-        else:
+    async def run_statement_return_rowcount(statement: str, arguments: tuple | list[tuple] = (), many=False):
+        import asyncio
+        from classes.connection_pool import DatabaseUnavailableError
+
+        def execute(connection):
+            with connection.cursor() as cursor:
+                if not many:
+                    cursor.execute(statement, arguments)
+                    return cursor.rowcount
+                # a batch is all-or-nothing; executemany turns an INSERT into a single multi-row statement
+                connection.start_transaction()
+                try:
+                    cursor.executemany(statement, arguments)
+                    connection.commit()
+                except:
+                    connection.rollback()
+                    raise
+                return cursor.rowcount
+
+        if many and len(arguments) == 0:
+            return 0
+        try:
+            async with Program.get_db_pool().connection() as connection:
+                Program.log(f"STATEMENT:({statement}) PARAM:{arguments if not many else f'{len(arguments)} rows'}",0)
+                return await asyncio.to_thread(execute, connection)
+        except DatabaseUnavailableError:
+            Program.log(f"Failed to call ({statement})",3)
+            return 0
+        
+
+    async def call_procedure_return_scalar(procedure: str, arguments: tuple):
+        import asyncio
+        from classes.connection_pool import DatabaseUnavailableError
+
+        def execute(connection):
+            with connection.cursor() as cursor:
+                cursor.callproc(procedure, arguments)
+                # drain the procedure's result sets so the connection is clean for the next borrower
+                for _ in cursor.stored_results():
+                    pass
+                return cursor.rowcount
+
+        try:
+            async with Program.get_db_pool().connection() as connection:
+                Program.log(f"SP:({procedure}) PARAM:{arguments}",0)
+                rowcount = await asyncio.to_thread(execute, connection)
+            Program.log(f"  SP returned rowcount={rowcount}",0)
+            return rowcount
+        except DatabaseUnavailableError:
             Program.log(f"Failed to call ({procedure})",3)
             return 0
         
@@ -181,15 +379,57 @@ class Utility:
     
 
     async def http_get_thinking(url: str, context: commands.Context) -> tuple[dict | str, ResponseType, int]:
+        # a cached answer is instant, so skip the typing indicator round-trip
+        cached = Utility.get_cached_http_response(url)
+        if cached is not None:
+            return cached
         async with context.channel.typing():
-            return await Utility.http_get(url)
+            return await Utility.http_get(url, check_cache=False)
+
+
+    def truncate(text: str, length: int) -> str:
+        return text if len(text) <= length else text[:length-3] + "..."
+
+
+    def normalize_url(url: str) -> str:
+        from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+        parts = urlsplit(url.strip())
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", query, ""))
+
+
+    def get_http_cache_ttl(url: str) -> int | None:
+        from urllib.parse import urlsplit
+        return Program.HTTP_CACHE_TTLS.get(urlsplit(url).hostname, None)
 
 
-    async def http_get(url: str) -> tuple[dict | str, ResponseType, int]:
+    def get_cached_http_response(url: str) -> tuple[dict | str, ResponseType, int] | None:
+        if Utility.get_http_cache_ttl(url) is None:
+            return None
+        cached = Program.get_http_cache().get(Utility.normalize_url(url))
+        if cached is not None:
+            Program.log(f"GET {url} (cached)",0)
+        return cached
+
+
+    async def http_get(url: str, check_cache=True) -> tuple[dict | str, ResponseType, int]:
+        cached = Utility.get_cached_http_response(url) if check_cache else None
+        if cached is not None:
+            return cached
+
+        result = await Utility.http_get_uncached(url)
+        ttl = Utility.get_http_cache_ttl(url)
+        if ttl is not None and Utility.is_200(result[2]):
+            Program.get_http_cache().set(Utility.normalize_url(url), result, ttl)
+        return result
+
+
+    async def http_get_uncached(url: str) -> tuple[dict | str, ResponseType, int]:
         Program.log(f"GET {url}",0)
-        async with aiohttp.ClientSession() as session:
+        session = Program.get_http_session()
+        async with Program.get_http_host_limiter(url):
             async with session.get(url) as response:
-                content_type: str = response.headers.get("content-type")
+                content_type: str = response.headers.get("content-type", "")
                 mime = ResponseType.UNKNOWN
                 if content_type.find("application/json") > -1:
                     mime = ResponseType.JSON
@@ -202,7 +442,39 @@ class Utility:
                 if mime == ResponseType.JSON:
                     return (await response.json(), mime, code)
                 else:
-                    return (response.text, mime, code)
+                    return (await response.text(), mime, code)
+
+
+    async def http_get_raw(url: str, headers: dict | None = None, timeout: float | None = None) -> tuple[bytes, dict, int]:
+        Program.log(f"GET {url}",0)
+        session = Program.get_http_session()
+        # fall back to the session-wide timeout unless the caller asked for its own
+        timeout_kwargs = {"timeout": aiohttp.ClientTimeout(total=timeout)} if timeout is not None else {}
+        async with Program.get_http_host_limiter(url):
+            async with session.get(url, headers=headers, **timeout_kwargs) as response:
+                return (await response.read(), dict(response.headers), response.status)
+
+
+    async def ffprobe(source: str, timeout: float = 30) -> dict | None:
+        # ffprobe's json for the first audio stream and the container, or None if it could not be read
+        import asyncio
+        import json
+        process = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "quiet", "-print_format", "json", "-show_format", "-show_streams", "-select_streams", "a:0", source,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+        try:
+            (output, _) = await asyncio.wait_for(process.communicate(), timeout=timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            Program.log(f"ffprobe timed out on {source}",2)
+            return None
+        if process.returncode != 0:
+            return None
+        try:
+            return json.loads(output)
+        except ValueError:
+            return None
 
 
     def build_embed_fields(embed: discord.Embed, name_values: list[tuple[str, object, bool | None]]) -> None: